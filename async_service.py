@@ -0,0 +1,132 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from main import BUSY_TIMEOUT, SEARCH_LIMIT, Service
+
+READER_THREADS = 4
+MAX_WRITE_BATCH = 256
+
+
+class AsyncService:
+    """Awaitable front end to Service for asyncio applications.
+
+    Reads run on a pool of reader threads, each with its own connection.
+    Writes are queued and handed to a single writer thread, which runs
+    everything that queued up meanwhile as one group commit.
+    """
+
+    def __init__(self, db_name, readers=READER_THREADS, max_batch=MAX_WRITE_BATCH, busy_timeout=BUSY_TIMEOUT):
+        self.service = Service(db_name, pooled=True, busy_timeout=busy_timeout)
+        self.max_batch = max_batch
+        self.commits = 0
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix='service-reader')
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix='service-writer')
+        self._queue = None
+        self._writer_task = None
+
+    async def _read(self, method_name, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, functools.partial(getattr(self.service, method_name), *args))
+
+    async def _write(self, method_name, *args):
+        if self._writer_task is None:
+            self._queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._write_loop())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((method_name, args, future))
+        return await future
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            calls = [(method_name, args) for method_name, args, future in batch]
+            try:
+                results = await loop.run_in_executor(self._writer, self.service.group_commit, calls)
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+            else:
+                self.commits += 1
+
+            for (method_name, args, future), (ok, value) in zip(batch, results):
+                if not future.done():
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+                self._queue.task_done()
+
+    async def close(self):
+        """Wait for queued writes, then stop the worker threads and close the database."""
+        if self._writer_task is not None:
+            await self._queue.join()
+            self._writer_task.cancel()
+            self._writer_task = None
+        self._readers.shutdown()
+        self._writer.shutdown()
+        self.service.close()
+
+    # Manage Services functions
+    async def add_service(self, name, price):
+        return await self._write('add_service', name, price)
+
+    async def remove_service(self, name):
+        return await self._write('remove_service', name)
+
+    async def list_services(self):
+        return await self._read('list_services')
+
+    async def name_check(self, service_name):
+        return await self._read('name_check', service_name)
+
+    async def get_service_id(self, service_name):
+        return await self._read('get_service_id', service_name)
+
+    # Manage Movies functions
+    async def add_movie(self, service_name, name, year, genre, rating, runtime):
+        return await self._write('add_movie', service_name, name, year, genre, rating, runtime)
+
+    async def remove_movie(self, service_name, movie_name):
+        return await self._write('remove_movie', service_name, movie_name)
+
+    async def edit_ranking(self, service_name, movie_name, rating):
+        return await self._write('edit_ranking', service_name, movie_name, rating)
+
+    async def movie_check(self, service_name, movie_name):
+        return await self._read('movie_check', service_name, movie_name)
+
+    async def name_year_check(self, movie_name, movie_year):
+        return await self._read('name_year_check', movie_name, movie_year)
+
+    async def list_movies(self, service_name):
+        return await self._read('list_movies', service_name)
+
+    # Manage TV_Series functions
+    async def add_series(self, service_name, series_name, genre, rating):
+        return await self._write('add_series', service_name, series_name, genre, rating)
+
+    async def remove_series(self, service_name, series_name):
+        return await self._write('remove_series', service_name, series_name)
+
+    async def remove_series_from_service(self, series_name, service_name):
+        return await self._write('remove_series_from_service', series_name, service_name)
+
+    async def add_season(self, service_name, series_name, season_number, year, episodes_number):
+        return await self._write('add_season', service_name, series_name, season_number, year, episodes_number)
+
+    async def remove_season(self, series_name, season_number):
+        return await self._write('remove_season', series_name, season_number)
+
+    async def add_ranking_series(self, series_name, rating):
+        return await self._write('add_ranking_series', series_name, rating)
+
+    async def list_series(self, service):
+        return await self._read('list_series', service)
+
+    # Search functions
+    async def search(self, query, limit=SEARCH_LIMIT):
+        return await self._read('search', query, limit)
@@ -0,0 +1,163 @@
+"""Benchmark Service operations against synthetic catalogs.
+
+Builds a catalog of each requested size with bulk_import, times every
+public Service operation on it and writes the results as JSON:
+
+    python bench.py --sizes 1000,100000 --output bench.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+
+from main import PROFILES, Service
+
+GENRES = ['Drama', 'Comedy', 'Action', 'Horror', 'Documentary', 'Animation', 'Thriller', 'Romance']
+DEFAULT_SIZES = '1000,10000,100000'
+DEFAULT_ITERATIONS = 200
+LIST_ITERATIONS = 10
+
+
+def generate_catalog(movies, services, series, seasons_per_series):
+    """Yield bulk_import rows for a synthetic catalog."""
+    for number in range(services):
+        yield {'type': 'service', 'name': f'Service {number}', 'price': 5 + number % 20}
+    for number in range(movies):
+        yield {'type': 'movie', 'service': f'Service {number % services}', 'name': f'Movie {number}',
+               'year': 1900 + number % 125, 'genre': GENRES[number % len(GENRES)],
+               'rating': number % 6, 'runtime': 60 + number % 120}
+    for number in range(series):
+        service_name = f'Service {number % services}'
+        yield {'type': 'series', 'service': service_name, 'name': f'Series {number}',
+               'genre': GENRES[number % len(GENRES)], 'rating': number % 6}
+        for season in range(1, seasons_per_series + 1):
+            yield {'type': 'season', 'service': service_name, 'series': f'Series {number}', 'season': season,
+                   'year': 1950 + (number + season) % 75, 'episodes': 6 + season}
+
+
+def percentile(latencies, fraction):
+    """Return the given percentile of an already sorted list."""
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+
+def summarize(size, operation, latencies, rows=1):
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'size': size,
+        'operation': operation,
+        'calls': len(latencies),
+        'ops_per_sec': len(latencies) * rows / total if total else None,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def time_calls(function, calls):
+    """Call function once per argument tuple and return the latency of each call."""
+    latencies = []
+    for args in calls:
+        start = time.perf_counter()
+        function(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_size(path, size, args):
+    rng = random.Random(size)
+    services = max(1, min(args.services, size))
+    series = max(1, size // args.series_ratio)
+
+    service = Service(path, profile=args.profile)
+    start = time.perf_counter()
+    report = service.bulk_import(generate_catalog(size, services, series, args.seasons))
+    results = [summarize(size, 'bulk_import', [time.perf_counter() - start], rows=len(report))]
+
+    def service_name():
+        return f'Service {rng.randrange(services)}'
+
+    def existing_movie():
+        number = rng.randrange(size)
+        return f'Service {number % services}', f'Movie {number}', 1900 + number % 125
+
+    n = args.iterations
+    listing = [(service_name(),) for _ in range(args.list_iterations)]
+    movies = [existing_movie() for _ in range(n)]
+    new_movies = [(service_name(), f'Bench Movie {number}') for number in range(n)]
+    new_series = [(service_name(), f'Bench Series {number}') for number in range(n)]
+
+    operations = [
+        ('name_check', service.name_check, [(service_name(),) for _ in range(n)]),
+        ('get_service_id', service.get_service_id, [(service_name(),) for _ in range(n)]),
+        ('movie_check', service.movie_check, [(name, movie) for name, movie, year in movies]),
+        ('name_year_check', service.name_year_check, [(movie, year) for name, movie, year in movies]),
+        ('search', service.search, [(f'Movie {rng.randrange(size)}',) for _ in range(n)]),
+        ('movies_page', service.movies_page, [(service_name(),) for _ in range(n)]),
+        ('list_services', service.list_services, [()] * args.list_iterations),
+        ('list_movies', service.list_movies, listing),
+        ('list_series', service.list_series, listing),
+        ('add_movie', service.add_movie, [(name, movie, 2000, 'Drama', 3, 90) for name, movie in new_movies]),
+        ('edit_ranking', service.edit_ranking, [(name, movie, 4) for name, movie in new_movies]),
+        ('remove_movie', service.remove_movie, new_movies),
+        ('add_series', service.add_series, [(name, series, 'Drama', 3) for name, series in new_series]),
+        ('add_season', service.add_season, [(name, series, 1, 2000, 8) for name, series in new_series]),
+        ('remove_season', service.remove_season, [(series, 1) for name, series in new_series]),
+        ('remove_series', service.remove_series, new_series),
+    ]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if args.replica:
+            # The replica must not see the file change, so it is timed before any writes
+            service.conn.execute('''PRAGMA wal_checkpoint(TRUNCATE)''')
+            replica = Service(path, read_only=True)
+            for operation, function, calls in [('movies_page (replica)', replica.movies_page, operations[5][2]),
+                                               ('list_movies (replica)', replica.list_movies, listing),
+                                               ('list_series (replica)', replica.list_series, listing)]:
+                results.append(summarize(size, operation, time_calls(function, calls)))
+            replica.close()
+        for operation, function, calls in operations:
+            results.append(summarize(size, operation, time_calls(function, calls)))
+    service.close()
+    for result in results:
+        result['profile'] = args.profile
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated movie counts')
+    parser.add_argument('--services', type=int, default=50, help='number of services')
+    parser.add_argument('--series-ratio', type=int, default=10, help='one series per this many movies')
+    parser.add_argument('--seasons', type=int, default=5, help='seasons per series')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS, help='calls per operation')
+    parser.add_argument('--list-iterations', type=int, default=LIST_ITERATIONS, help='calls per full listing')
+    parser.add_argument('--profile', choices=sorted(PROFILES), help='Service PRAGMA profile to benchmark')
+    parser.add_argument('--replica', action='store_true', help='also time reads on a read-only replica')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the JSON results')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (int(size) for size in args.sizes.split(',')):
+            results.extend(bench_size(os.path.join(directory, f"bench-{size}.db"), size, args))
+
+    for result in results:
+        print(f"{result['size']:>10} {result['operation']:<22} {result['ops_per_sec']:>12.1f} ops/s "
+              f"p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'results': results,
+        }, f, indent=2)
+    print(f"Results written to '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+import functools
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+SAMPLE_SIZE = 1024
+SLOW_QUERY_LOG_SIZE = 100
+QUANTILES = (0.5, 0.9, 0.99)
+
+logger = logging.getLogger(__name__)
+
+
+class _Metric:
+    """Call count, total time and recent latency samples for one statement or method."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.seconds += elapsed
+        self.samples.append(elapsed)
+
+    def quantiles(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+
+class QueryStats:
+    """Timings for SQL statements, commits and Service methods.
+
+    Statements slower than slow_query_threshold seconds are logged as
+    warnings and kept in slow_queries.
+    """
+
+    def __init__(self, slow_query_threshold=None):
+        self.slow_query_threshold = slow_query_threshold
+        self.statements = {}
+        self.methods = {}
+        self.commits = _Metric()
+        self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._lock = threading.Lock()
+
+    def record_statement(self, sql, elapsed):
+        with self._lock:
+            metric = self.statements.get(sql)
+            if metric is None:
+                metric = self.statements[sql] = _Metric()
+            metric.add(elapsed)
+        if self.slow_query_threshold is not None and elapsed >= self.slow_query_threshold:
+            sql = _normalize(sql)
+            self.slow_queries.append((time.time(), elapsed, sql))
+            logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, sql)
+
+    def record_rows(self, sql, rows):
+        with self._lock:
+            metric = self.statements.get(sql)
+            if metric is not None:
+                metric.rows += rows
+
+    def record_method(self, name, elapsed):
+        with self._lock:
+            metric = self.methods.get(name)
+            if metric is None:
+                metric = self.methods[name] = _Metric()
+            metric.add(elapsed)
+
+    def record_commit(self, elapsed):
+        with self._lock:
+            self.commits.add(elapsed)
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.methods.clear()
+            self.commits = _Metric()
+            self.slow_queries.clear()
+
+    def snapshot(self):
+        """Return all collected stats as a dict of plain values."""
+        def describe(metric):
+            return {
+                'calls': metric.calls,
+                'seconds': metric.seconds,
+                'rows': metric.rows,
+                'quantiles': metric.quantiles(),
+            }
+
+        with self._lock:
+            statements = {}
+            for sql, metric in self.statements.items():
+                statements[_normalize(sql)] = describe(metric)
+            return {
+                'statements': statements,
+                'methods': {name: describe(metric) for name, metric in self.methods.items()},
+                'commits': {'calls': self.commits.calls, 'seconds': self.commits.seconds},
+                'slow_queries': list(self.slow_queries),
+            }
+
+    def prometheus(self, prefix='service'):
+        """Return the stats in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for kind, label in (('statement', 'sql'), ('method', 'method')):
+            entries = snapshot[kind + 's']
+            lines.append(f'# TYPE {prefix}_{kind}_calls_total counter')
+            for key, entry in entries.items():
+                lines.append(f'{prefix}_{kind}_calls_total{{{label}="{_escape(key)}"}} {entry["calls"]}')
+            lines.append(f'# TYPE {prefix}_{kind}_seconds summary')
+            for key, entry in entries.items():
+                labels = f'{label}="{_escape(key)}"'
+                for quantile, value in entry['quantiles'].items():
+                    lines.append(f'{prefix}_{kind}_seconds{{{labels},quantile="{quantile}"}} {value}')
+                lines.append(f'{prefix}_{kind}_seconds_sum{{{labels}}} {entry["seconds"]}')
+                lines.append(f'{prefix}_{kind}_seconds_count{{{labels}}} {entry["calls"]}')
+        lines.append(f'# TYPE {prefix}_statement_rows_total counter')
+        for sql, entry in snapshot['statements'].items():
+            lines.append(f'{prefix}_statement_rows_total{{sql="{_escape(sql)}"}} {entry["rows"]}')
+        lines.append(f'# TYPE {prefix}_commits_total counter')
+        lines.append(f'{prefix}_commits_total {snapshot["commits"]["calls"]}')
+        lines.append(f'# TYPE {prefix}_commit_seconds_total counter')
+        lines.append(f'{prefix}_commit_seconds_total {snapshot["commits"]["seconds"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _normalize(sql):
+    return ' '.join(sql.split())
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports statement timings and returned rows to its connection's stats."""
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._sql = sql
+            self.connection.stats.record_statement(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql = sql
+            self.connection.stats.record_statement(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self.connection.stats.record_rows(self._sql, 1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.connection.stats.record_rows(self._sql, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self.connection.stats.record_rows(self._sql, len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self.connection.stats.record_rows(self._sql, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors and commits are timed into self.stats."""
+
+    stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.stats.record_commit(time.perf_counter() - start)
+
+
+def timed_method(stats, name, method):
+    """Wrap a bound method so each call is recorded under its name."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            stats.record_method(name, time.perf_counter() - start)
+    return wrapper
@@ -0,0 +1,284 @@
+"""Load large catalog files using a pool of worker processes.
+
+Workers parse and validate chunks of the file in parallel, and each one
+writes the valid rows to its own staging database. Once every chunk has
+been staged, the staging databases are attached to the catalog database
+one at a time and merged into it with INSERT ... SELECT in one
+transaction:
+
+    python loader.py catalog.jsonl --db test.db --workers 8
+
+Rows are merged table by table (services, series, movies, then seasons)
+rather than in file order. Duplicates within the file keep their first
+occurrence, and conflicts with the catalog are rejected as bulk_import
+does. Rejected rows are reported with their reason.
+"""
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+
+from main import DB_NAME, Service, validate_import_row
+
+CHUNK_ROWS = 10000
+
+# Staged rows by type: table and the columns after Row_Number, in IMPORT_COLUMNS order
+STAGES = {
+    'service': ('Services', ('Name', 'Price')),
+    'series': ('Series', ('Service', 'Name', 'Genre', 'Rating')),
+    'movie': ('Movies', ('Service', 'Name', 'Year', 'Genre', 'Rating', 'Runtime')),
+    'season': ('Seasons', ('Service', 'Series', 'Season', 'Year', 'Episodes')),
+}
+
+# Each worker process's staging database
+_stage = None
+
+
+def _create_stage(conn, prefix):
+    for kind, (table, columns) in STAGES.items():
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {prefix}{table} (
+                             Row_Number INTEGER PRIMARY KEY, {', '.join(columns)},
+                             Status TEXT, Message TEXT)''')
+
+
+def _open_stage(directory):
+    """Pool initializer: open a staging database private to this worker."""
+    global _stage
+    _stage = sqlite3.connect(os.path.join(directory, f'stage-{os.getpid()}.db'))
+    _stage.execute('''PRAGMA journal_mode = OFF''')
+    _stage.execute('''PRAGMA synchronous = OFF''')
+    _create_stage(_stage, 'Stage_')
+
+
+def _stage_chunk(chunk):
+    """Parse, validate and stage one chunk of rows; return (rows staged, rejected rows)."""
+    start, fieldnames, records = chunk
+    staged = {kind: [] for kind in STAGES}
+    rejects = []
+    for row_number, record in enumerate(records, start=start):
+        if fieldnames is None:
+            try:
+                row = json.loads(record)
+            except ValueError:
+                row = None
+            if not isinstance(row, dict):
+                rejects.append((row_number, None, None, 'error', "Invalid JSON."))
+                continue
+        else:
+            row = {field: value for field, value in zip(fieldnames, record) if value != ''}
+        try:
+            values = validate_import_row(row)
+        except ValueError as e:
+            rejects.append((row_number, row.get('type'), row.get('name') or row.get('series'), 'error', str(e)))
+        else:
+            staged[row['type']].append((row_number,) + values)
+
+    for kind, rows in staged.items():
+        table, columns = STAGES[kind]
+        _stage.executemany(f'''INSERT INTO Stage_{table} (Row_Number, {', '.join(columns)})
+                               VALUES ({', '.join('?' * (len(columns) + 1))})''', rows)
+    _stage.commit()
+    return sum(len(rows) for rows in staged.values()), rejects
+
+
+def _read_chunks(path, chunk_rows):
+    """Yield (first row number, CSV field names or None, records) chunks of a catalog file.
+
+    JSONL records are left as lines for the workers to parse; CSV is split
+    into fields here so quoted values may span lines.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            records = csv.reader(f)
+            fieldnames = next(records, None)
+        else:
+            records = (line for line in f if line.strip())
+            fieldnames = None
+        start = 1
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == chunk_rows:
+                yield start, fieldnames, chunk
+                start += len(chunk)
+                chunk = []
+        if chunk:
+            yield start, fieldnames, chunk
+
+
+# Set-based versions of the checks _BulkImport makes row by row, run in order on the merged staging tables.
+# Each marks the rows it rejects; rows still unmarked at the end are inserted.
+_MERGE_CHECKS = [
+    '''UPDATE Load_Services SET Status = 'conflict', Message = printf('Service ''%s'' already exists.', Name)
+       WHERE Name IN (SELECT Name FROM main.Services)
+          OR Row_Number > (SELECT MIN(Row_Number) FROM Load_Services AS First WHERE First.Name = Load_Services.Name)''',
+
+    '''UPDATE Load_Series SET Status = 'error', Message = 'Service not found'
+       WHERE Service NOT IN (SELECT Name FROM main.Services)''',
+    '''UPDATE Load_Series SET Status = 'conflict', Message = Name || ' already exists on ' || Service || '.'
+       WHERE Status IS NULL AND (
+           EXISTS (SELECT 1 FROM main.Series_Service
+                   JOIN main.TV_Series ON TV_Series.ID = Series_ID JOIN main.Services ON Services.ID = Service_ID
+                   WHERE TV_Series.Name = Load_Series.Name AND Services.Name = Load_Series.Service)
+           OR Row_Number > (SELECT MIN(Row_Number) FROM Load_Series AS First
+                            WHERE First.Name = Load_Series.Name AND First.Service = Load_Series.Service))''',
+
+    '''UPDATE Load_Movies SET Status = 'error', Message = printf('Service ''%s'' not found.', Service)
+       WHERE Service NOT IN (SELECT Name FROM main.Services)''',
+    '''UPDATE Load_Movies SET Status = 'conflict', Message = 'Movie already exists.'
+       WHERE Status IS NULL AND (
+           EXISTS (SELECT 1 FROM main.Movies WHERE Movies.Name = Load_Movies.Name AND Movies.Year IS Load_Movies.Year)
+           OR EXISTS (SELECT 1 FROM Load_Movies AS First
+                      WHERE First.Name = Load_Movies.Name AND First.Year IS Load_Movies.Year
+                      AND First.Row_Number < Load_Movies.Row_Number
+                      AND First.Service IN (SELECT Name FROM main.Services)))''',
+
+    '''UPDATE Load_Seasons SET Status = 'error', Message = Service || ' does not exist on the system.'
+       WHERE Service NOT IN (SELECT Name FROM main.Services)''',
+    '''UPDATE Load_Seasons SET Status = 'conflict', Message = Series || ' season ' || Season || ' already exists on ' ||
+           (SELECT Services.Name FROM main.Season
+            JOIN main.TV_Series ON TV_Series.ID = Series_ID JOIN main.Services ON Services.ID = Service_ID
+            WHERE TV_Series.Name = Load_Seasons.Series AND Season_Number IS Load_Seasons.Season) || '.'
+       WHERE Status IS NULL AND EXISTS (
+           SELECT 1 FROM main.Season JOIN main.TV_Series ON TV_Series.ID = Series_ID
+           WHERE TV_Series.Name = Load_Seasons.Series AND Season_Number IS Load_Seasons.Season)''',
+    '''UPDATE Load_Seasons SET Status = 'conflict', Message = Series || ' season ' || Season || ' already exists on ' ||
+           (SELECT Service FROM Load_Seasons AS First
+            WHERE First.Series = Load_Seasons.Series AND First.Season IS Load_Seasons.Season
+            ORDER BY Row_Number LIMIT 1) || '.'
+       WHERE Status IS NULL AND Row_Number > (
+           SELECT MIN(Row_Number) FROM Load_Seasons AS First
+           WHERE First.Series = Load_Seasons.Series AND First.Season IS Load_Seasons.Season
+           AND First.Service IN (SELECT Name FROM main.Services))''',
+    '''UPDATE Load_Seasons SET Status = 'error', Message = Series || ' was not found on ' || Service || '.'
+       WHERE Status IS NULL AND NOT EXISTS (
+           SELECT 1 FROM main.Series_Service
+           JOIN main.TV_Series ON TV_Series.ID = Series_ID JOIN main.Services ON Services.ID = Service_ID
+           WHERE TV_Series.Name = Load_Seasons.Series AND Services.Name = Load_Seasons.Service)''',
+]
+
+# Checks that depend on rows inserted by the earlier tables run right before that table's inserts
+_MERGE_STEPS = [
+    (_MERGE_CHECKS[0:1], [
+        '''INSERT INTO main.Services (Name, Price)
+           SELECT Name, Price FROM Load_Services WHERE Status IS NULL ORDER BY Row_Number''',
+    ]),
+    (_MERGE_CHECKS[1:3], [
+        '''INSERT INTO main.TV_Series (Name, Genre, Rating)
+           SELECT Name, Genre, Rating FROM Load_Series
+           WHERE Status IS NULL AND Name NOT IN (SELECT Name FROM main.TV_Series)
+           AND Row_Number = (SELECT MIN(Row_Number) FROM Load_Series AS First
+                             WHERE First.Name = Load_Series.Name AND First.Status IS NULL)
+           ORDER BY Row_Number''',
+        '''INSERT INTO main.Series_Service (Series_ID, Service_ID)
+           SELECT TV_Series.ID, Services.ID FROM Load_Series
+           JOIN main.TV_Series ON TV_Series.Name = Load_Series.Name
+           JOIN main.Services ON Services.Name = Load_Series.Service
+           WHERE Status IS NULL ORDER BY Row_Number''',
+    ]),
+    (_MERGE_CHECKS[3:5], [
+        '''INSERT INTO main.Movies (Name, Year, Genre, Rating, Runtime, Service_ID)
+           SELECT Load_Movies.Name, Year, Genre, Rating, Runtime, Services.ID FROM Load_Movies
+           JOIN main.Services ON Services.Name = Load_Movies.Service
+           WHERE Status IS NULL ORDER BY Row_Number''',
+    ]),
+    (_MERGE_CHECKS[5:], [
+        '''INSERT INTO main.Season (Series_ID, Season_Number, Year, Episodes_Number, Service_ID)
+           SELECT TV_Series.ID, Season, Year, Episodes, Services.ID FROM Load_Seasons
+           JOIN main.TV_Series ON TV_Series.Name = Load_Seasons.Series
+           JOIN main.Services ON Services.Name = Load_Seasons.Service
+           WHERE Status IS NULL ORDER BY Row_Number''',
+    ]),
+]
+
+_LOAD_INDEXES = [
+    '''CREATE INDEX temp.idx_load_services ON Load_Services (Name, Row_Number)''',
+    '''CREATE INDEX temp.idx_load_series ON Load_Series (Name, Service, Row_Number)''',
+    '''CREATE INDEX temp.idx_load_movies ON Load_Movies (Name, Year, Row_Number)''',
+    '''CREATE INDEX temp.idx_load_seasons ON Load_Seasons (Series, Season, Row_Number)''',
+]
+
+
+def merge_stages(service, paths):
+    """Merge staging databases into the catalog and return (rows added per type, rejected rows)."""
+    conn = service.conn
+    _create_stage(conn, 'temp.Load_')
+    conn.commit()
+    for number, path in enumerate(paths):
+        # ATTACH is not allowed inside a transaction, so each shard is copied in its own
+        conn.execute('''ATTACH DATABASE ? AS stage''', (path,))
+        for kind, (table, columns) in STAGES.items():
+            conn.execute(f'''INSERT INTO temp.Load_{table} SELECT * FROM stage.Stage_{table}''')
+        conn.commit()
+        conn.execute('''DETACH DATABASE stage''')
+    for statement in _LOAD_INDEXES:
+        conn.execute(statement)
+    conn.commit()
+
+    try:
+        with service.bulk_load():
+            cursor = conn.cursor()
+            for checks, inserts in _MERGE_STEPS:
+                for statement in checks + inserts:
+                    cursor.execute(statement)
+
+        added = {}
+        rejects = []
+        for kind, (table, columns) in STAGES.items():
+            name_column = 'Series' if kind == 'season' else 'Name'
+            added[kind] = conn.execute(f'''SELECT COUNT(*) FROM Load_{table} WHERE Status IS NULL''').fetchone()[0]
+            rejects.extend((row_number, kind, name, status, message) for row_number, name, status, message
+                           in conn.execute(f'''SELECT Row_Number, {name_column}, Status, Message FROM Load_{table}
+                                               WHERE Status IS NOT NULL'''))
+    finally:
+        for kind, (table, columns) in STAGES.items():
+            conn.execute(f'''DROP TABLE temp.Load_{table}''')
+        conn.commit()
+    service.invalidate_service_cache()
+    return added, rejects
+
+
+def load_catalog(db_name, path, workers=None, chunk_rows=CHUNK_ROWS):
+    """Load a .csv or .jsonl catalog file in parallel; return (rows added per type, rejected rows).
+
+    Rejected rows are (row_number, type, name, status, message) tuples,
+    status being 'error' for invalid rows and 'conflict' for duplicates.
+    """
+    rejects = []
+    with tempfile.TemporaryDirectory() as directory:
+        with multiprocessing.Pool(workers, initializer=_open_stage, initargs=(directory,)) as pool:
+            for staged, chunk_rejects in pool.imap_unordered(_stage_chunk, _read_chunks(path, chunk_rows)):
+                rejects.extend(chunk_rejects)
+            pool.close()
+            pool.join()
+
+        service = Service(db_name)
+        try:
+            added, merge_rejects = merge_stages(service, sorted(glob.glob(os.path.join(directory, 'stage-*.db'))))
+        finally:
+            service.close()
+    rejects.extend(merge_rejects)
+    rejects.sort()
+    return added, rejects
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='.csv or .jsonl catalog file')
+    parser.add_argument('--db', default=DB_NAME, help='catalog database')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='rows per worker task')
+    args = parser.parse_args(argv)
+
+    added, rejects = load_catalog(args.db, args.path, args.workers, args.chunk_rows)
+    for row_number, kind, name, status, message in rejects:
+        print(f"Row {row_number} ({kind} '{name}'): {status}: {message}")
+    print(f"Loaded {sum(added.values())} rows from '{args.path}', rejected {len(rejects)}.")
+
+
+if __name__ == '__main__':
+    main()
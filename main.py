@@ -1,12 +1,440 @@
+import contextlib
+import csv
+import functools
+import json
+import pathlib
+import re
 import sqlite3
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+DB_NAME = 'test.db'
+IMPORT_BATCH_SIZE = 1000
+# Columns of each type of catalog import row, in the order validate_import_row returns them
+IMPORT_COLUMNS = {
+    'service': ('name', 'price'),
+    'series': ('service', 'name', 'genre', 'rating'),
+    'movie': ('service', 'name', 'year', 'genre', 'rating', 'runtime'),
+    'season': ('service', 'series', 'season', 'year', 'episodes'),
+}
+IMPORT_REQUIRED = {'service', 'series', 'name', 'genre'}
+IMPORT_INTEGERS = {'price', 'year', 'rating', 'runtime', 'season', 'episodes'}
+# CHECK ranges of the catalog columns by row type and column; None means unbounded
+IMPORT_RANGES = {
+    ('service', 'price'): (0, None),
+    ('series', 'rating'): (0, 5),
+    ('movie', 'year'): (1888, 2025),
+    ('movie', 'rating'): (0, 5),
+    ('movie', 'runtime'): (0, 10000),
+}
+SERVICE_CACHE_SIZE = 1024
+BUSY_TIMEOUT = 5.0
+LIST_PAGE_SIZE = 500
+SEARCH_LIMIT = 20
+CHANGES_LIMIT = 1000
+CHECK_CHUNK_SIZE = 500
+TOP_LIMIT = 10
+SIMILAR_YEARS = 5
+
+# PRAGMA settings applied to every connection for each Service profile; pooled Services always use WAL.
+# cache_size is in KiB when negative; mmap_size is in bytes.
+PROFILES = {
+    # Every commit is synced to disk before it returns
+    'durable': {'journal_mode': 'WAL', 'synchronous': 'FULL', 'cache_size': -16384, 'mmap_size': 0,
+                'temp_store': 'DEFAULT'},
+    # Commits survive application crashes; a power loss can lose the last few
+    'balanced': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -65536, 'mmap_size': 268435456,
+                 'temp_store': 'MEMORY'},
+    # For loading a catalog that can be rebuilt from its source: a crash can corrupt the database
+    'bulk-load': {'journal_mode': 'MEMORY', 'synchronous': 'OFF', 'cache_size': -262144, 'mmap_size': 1073741824,
+                  'temp_store': 'MEMORY'},
+    # Default for read_only replicas
+    'replica': {'cache_size': -65536, 'mmap_size': 1073741824, 'temp_store': 'MEMORY'},
+}
+
+# Orderings for movies_page: column, its position in a row, and whether ties are broken by ID in the
+# opposite direction. Best rated first is broken by oldest first, as in top_movies, so that it can
+# be read straight from idx_movies_service_rating.
+MOVIE_ORDERS = {
+    'id': ('ID', 0, False),
+    'name': ('Name', 1, False),
+    'year': ('Year', 2, False),
+    'rating': ('Rating', 4, True),
+}
+
+
+def _change_log_triggers(table, key, columns):
+    """SQL for the triggers that append every insert, update and delete on a table to Change_Log."""
+    def as_json(row, names):
+        return 'json_object(' + ', '.join(f"'{name}', {row}.{name}" for name in names) + ')'
+
+    return [
+        f'''CREATE TRIGGER {table.lower()}_log_insert AFTER INSERT ON {table} BEGIN
+               INSERT INTO Change_Log (Table_Name, Op, Row_Key, Row_Data)
+               VALUES ('{table}', 'insert', {as_json('new', key)}, {as_json('new', columns)});
+           END''',
+        # An update that changes the key is logged as a delete of the old key as well
+        f'''CREATE TRIGGER {table.lower()}_log_update AFTER UPDATE ON {table} BEGIN
+               INSERT INTO Change_Log (Table_Name, Op, Row_Key)
+               SELECT '{table}', 'delete', {as_json('old', key)}
+               WHERE {as_json('old', key)} IS NOT {as_json('new', key)};
+               INSERT INTO Change_Log (Table_Name, Op, Row_Key, Row_Data)
+               VALUES ('{table}', 'update', {as_json('new', key)}, {as_json('new', columns)});
+           END''',
+        f'''CREATE TRIGGER {table.lower()}_log_delete AFTER DELETE ON {table} BEGIN
+               INSERT INTO Change_Log (Table_Name, Op, Row_Key) VALUES ('{table}', 'delete', {as_json('old', key)});
+           END''',
+    ]
+
+
+# Schema migrations, applied in order. PRAGMA user_version holds the number already applied.
+MIGRATIONS = [
+    # 1: indexes for every name lookup done by Service
+    [
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_services_name ON Services (Name)''',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_tv_series_name ON TV_Series (Name)''',
+        '''CREATE INDEX IF NOT EXISTS idx_movies_service_name ON Movies (Service_ID, Name)''',
+        '''CREATE INDEX IF NOT EXISTS idx_movies_name_year ON Movies (Name, Year)''',
+        '''CREATE INDEX IF NOT EXISTS idx_season_service ON Season (Service_Name, Series_Name, Season_Number)''',
+    ],
+    # 2: keyset pagination of a service's movies by ID
+    [
+        '''CREATE INDEX IF NOT EXISTS idx_movies_service ON Movies (Service_ID)''',
+    ],
+    # 3: full-text search over movie and series names and genres, kept in sync by triggers
+    [
+        '''CREATE VIRTUAL TABLE Movies_Search USING fts5(
+               Name, Genre, content='Movies', content_rowid='ID', prefix='2 3')''',
+        '''CREATE TRIGGER movies_search_insert AFTER INSERT ON Movies BEGIN
+               INSERT INTO Movies_Search (rowid, Name, Genre) VALUES (new.ID, new.Name, new.Genre);
+           END''',
+        '''CREATE TRIGGER movies_search_delete AFTER DELETE ON Movies BEGIN
+               INSERT INTO Movies_Search (Movies_Search, rowid, Name, Genre) VALUES ('delete', old.ID, old.Name, old.Genre);
+           END''',
+        '''CREATE TRIGGER movies_search_update AFTER UPDATE OF Name, Genre ON Movies BEGIN
+               INSERT INTO Movies_Search (Movies_Search, rowid, Name, Genre) VALUES ('delete', old.ID, old.Name, old.Genre);
+               INSERT INTO Movies_Search (rowid, Name, Genre) VALUES (new.ID, new.Name, new.Genre);
+           END''',
+        '''INSERT INTO Movies_Search (Movies_Search) VALUES ('rebuild')''',
+        '''INSERT INTO Movies_Search (Movies_Search, rank) VALUES ('rank', 'bm25(10.0, 1.0)')''',
+
+        '''CREATE VIRTUAL TABLE Series_Search USING fts5(
+               Name, Genre, content='TV_Series', content_rowid='ID', prefix='2 3')''',
+        '''CREATE TRIGGER series_search_insert AFTER INSERT ON TV_Series BEGIN
+               INSERT INTO Series_Search (rowid, Name, Genre) VALUES (new.ID, new.Name, new.Genre);
+           END''',
+        '''CREATE TRIGGER series_search_delete AFTER DELETE ON TV_Series BEGIN
+               INSERT INTO Series_Search (Series_Search, rowid, Name, Genre) VALUES ('delete', old.ID, old.Name, old.Genre);
+           END''',
+        '''CREATE TRIGGER series_search_update AFTER UPDATE OF Name, Genre ON TV_Series BEGIN
+               INSERT INTO Series_Search (Series_Search, rowid, Name, Genre) VALUES ('delete', old.ID, old.Name, old.Genre);
+               INSERT INTO Series_Search (rowid, Name, Genre) VALUES (new.ID, new.Name, new.Genre);
+           END''',
+        '''INSERT INTO Series_Search (Series_Search) VALUES ('rebuild')''',
+        '''INSERT INTO Series_Search (Series_Search, rank) VALUES ('rank', 'bm25(10.0, 1.0)')''',
+    ],
+    # 4: key Series_Service and Season on integer IDs instead of names
+    [
+        '''CREATE TABLE Series_Service_New (
+               Series_ID INTEGER NOT NULL,
+               Service_ID INTEGER NOT NULL,
+               FOREIGN KEY (Series_ID) REFERENCES TV_Series (ID) ON DELETE CASCADE,
+               FOREIGN KEY (Service_ID) REFERENCES Services (ID) ON DELETE CASCADE,
+               UNIQUE (Series_ID, Service_ID)
+           )''',
+        '''INSERT INTO Series_Service_New (Series_ID, Service_ID)
+           SELECT TV_Series.ID, Services.ID FROM Series_Service
+           JOIN TV_Series ON TV_Series.Name = Series_Service.Series_Name
+           JOIN Services ON Services.Name = Series_Service.Service_Name''',
+        '''DROP TABLE Series_Service''',
+        '''ALTER TABLE Series_Service_New RENAME TO Series_Service''',
+        '''CREATE INDEX idx_series_service_service ON Series_Service (Service_ID)''',
+
+        '''CREATE TABLE Season_New (
+               Series_ID INTEGER NOT NULL,
+               Season_Number INTEGER,
+               Year INTEGER,
+               Episodes_Number INTEGER,
+               Service_ID INTEGER NOT NULL,
+               FOREIGN KEY (Series_ID) REFERENCES TV_Series (ID) ON DELETE CASCADE,
+               FOREIGN KEY (Service_ID) REFERENCES Services (ID) ON DELETE CASCADE,
+               UNIQUE (Series_ID, Season_Number)
+           )''',
+        '''INSERT INTO Season_New (Series_ID, Season_Number, Year, Episodes_Number, Service_ID)
+           SELECT TV_Series.ID, Season.Season_Number, Season.Year, Season.Episodes_Number, Services.ID FROM Season
+           JOIN TV_Series ON TV_Series.Name = Season.Series_Name
+           JOIN Services ON Services.Name = Season.Service_Name''',
+        '''DROP TABLE Season''',
+        '''ALTER TABLE Season_New RENAME TO Season''',
+        '''CREATE INDEX idx_season_service ON Season (Service_ID, Series_ID, Season_Number)''',
+    ],
+    # 5: per-service totals for service_stats, kept up to date by triggers
+    [
+        '''CREATE TABLE Service_Stats (
+               Service_ID INTEGER PRIMARY KEY,
+               Movies INTEGER NOT NULL DEFAULT 0,
+               Rated_Movies INTEGER NOT NULL DEFAULT 0,
+               Rating_Sum INTEGER NOT NULL DEFAULT 0,
+               Runtime_Sum INTEGER NOT NULL DEFAULT 0,
+               Series INTEGER NOT NULL DEFAULT 0,
+               Seasons INTEGER NOT NULL DEFAULT 0,
+               Episodes INTEGER NOT NULL DEFAULT 0,
+               FOREIGN KEY (Service_ID) REFERENCES Services (ID) ON DELETE CASCADE
+           )''',
+        '''INSERT INTO Service_Stats (Service_ID) SELECT ID FROM Services''',
+        '''UPDATE Service_Stats SET (Movies, Rated_Movies, Rating_Sum, Runtime_Sum) = (
+               SELECT COUNT(*), COUNT(Rating), COALESCE(SUM(Rating), 0), COALESCE(SUM(Runtime), 0)
+               FROM Movies WHERE Movies.Service_ID = Service_Stats.Service_ID)''',
+        '''UPDATE Service_Stats SET Series = (
+               SELECT COUNT(*) FROM Series_Service WHERE Series_Service.Service_ID = Service_Stats.Service_ID)''',
+        '''UPDATE Service_Stats SET (Seasons, Episodes) = (
+               SELECT COUNT(*), COALESCE(SUM(Episodes_Number), 0)
+               FROM Season WHERE Season.Service_ID = Service_Stats.Service_ID)''',
+        '''CREATE TRIGGER services_stats_insert AFTER INSERT ON Services BEGIN
+               INSERT INTO Service_Stats (Service_ID) VALUES (new.ID);
+           END''',
+        '''CREATE TRIGGER movies_stats_insert AFTER INSERT ON Movies BEGIN
+               UPDATE Service_Stats SET Movies = Movies + 1, Rated_Movies = Rated_Movies + (new.Rating IS NOT NULL),
+                   Rating_Sum = Rating_Sum + COALESCE(new.Rating, 0), Runtime_Sum = Runtime_Sum + COALESCE(new.Runtime, 0)
+               WHERE Service_ID = new.Service_ID;
+           END''',
+        '''CREATE TRIGGER movies_stats_delete AFTER DELETE ON Movies BEGIN
+               UPDATE Service_Stats SET Movies = Movies - 1, Rated_Movies = Rated_Movies - (old.Rating IS NOT NULL),
+                   Rating_Sum = Rating_Sum - COALESCE(old.Rating, 0), Runtime_Sum = Runtime_Sum - COALESCE(old.Runtime, 0)
+               WHERE Service_ID = old.Service_ID;
+           END''',
+        '''CREATE TRIGGER movies_stats_update AFTER UPDATE OF Rating, Runtime, Service_ID ON Movies BEGIN
+               UPDATE Service_Stats SET Movies = Movies - 1, Rated_Movies = Rated_Movies - (old.Rating IS NOT NULL),
+                   Rating_Sum = Rating_Sum - COALESCE(old.Rating, 0), Runtime_Sum = Runtime_Sum - COALESCE(old.Runtime, 0)
+               WHERE Service_ID = old.Service_ID;
+               UPDATE Service_Stats SET Movies = Movies + 1, Rated_Movies = Rated_Movies + (new.Rating IS NOT NULL),
+                   Rating_Sum = Rating_Sum + COALESCE(new.Rating, 0), Runtime_Sum = Runtime_Sum + COALESCE(new.Runtime, 0)
+               WHERE Service_ID = new.Service_ID;
+           END''',
+        '''CREATE TRIGGER series_service_stats_insert AFTER INSERT ON Series_Service BEGIN
+               UPDATE Service_Stats SET Series = Series + 1 WHERE Service_ID = new.Service_ID;
+           END''',
+        '''CREATE TRIGGER series_service_stats_delete AFTER DELETE ON Series_Service BEGIN
+               UPDATE Service_Stats SET Series = Series - 1 WHERE Service_ID = old.Service_ID;
+           END''',
+        '''CREATE TRIGGER season_stats_insert AFTER INSERT ON Season BEGIN
+               UPDATE Service_Stats SET Seasons = Seasons + 1, Episodes = Episodes + COALESCE(new.Episodes_Number, 0)
+               WHERE Service_ID = new.Service_ID;
+           END''',
+        '''CREATE TRIGGER season_stats_delete AFTER DELETE ON Season BEGIN
+               UPDATE Service_Stats SET Seasons = Seasons - 1, Episodes = Episodes - COALESCE(old.Episodes_Number, 0)
+               WHERE Service_ID = old.Service_ID;
+           END''',
+        '''CREATE TRIGGER season_stats_update AFTER UPDATE OF Episodes_Number, Service_ID ON Season BEGIN
+               UPDATE Service_Stats SET Seasons = Seasons - 1, Episodes = Episodes - COALESCE(old.Episodes_Number, 0)
+               WHERE Service_ID = old.Service_ID;
+               UPDATE Service_Stats SET Seasons = Seasons + 1, Episodes = Episodes + COALESCE(new.Episodes_Number, 0)
+               WHERE Service_ID = new.Service_ID;
+           END''',
+    ],
+    # 6: append-only log of every change to the catalog tables, read by changes() and subscribers
+    [
+        '''CREATE TABLE Change_Log (
+               Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+               Table_Name TEXT NOT NULL,
+               Op TEXT NOT NULL CHECK (Op IN ('insert', 'update', 'delete')),
+               Row_Key TEXT NOT NULL,
+               Row_Data TEXT
+           )''',
+        *_change_log_triggers('Services', ('ID',), ('ID', 'Name', 'Price')),
+        *_change_log_triggers('Movies', ('ID',), ('ID', 'Name', 'Year', 'Genre', 'Rating', 'Runtime', 'Service_ID')),
+        *_change_log_triggers('TV_Series', ('ID',), ('ID', 'Name', 'Genre', 'Rating')),
+        *_change_log_triggers('Series_Service', ('Series_ID', 'Service_ID'), ('Series_ID', 'Service_ID')),
+        *_change_log_triggers('Season', ('Series_ID', 'Season_Number'),
+                              ('Series_ID', 'Season_Number', 'Year', 'Episodes_Number', 'Service_ID')),
+    ],
+    # 7: rating-ordered indexes, so top_movies, top_series and similar_movies read only the rows they return
+    [
+        '''CREATE INDEX idx_movies_rating ON Movies (Rating DESC, ID)''',
+        '''CREATE INDEX idx_movies_service_rating ON Movies (Service_ID, Rating DESC, ID)''',
+        '''CREATE INDEX idx_movies_genre_rating ON Movies (Genre, Rating DESC, ID)''',
+        '''CREATE INDEX idx_movies_service_genre_rating ON Movies (Service_ID, Genre, Rating DESC, ID)''',
+        '''CREATE INDEX idx_movies_genre_year ON Movies (Genre, Year, Rating)''',
+        '''CREATE INDEX idx_tv_series_rating ON TV_Series (Rating DESC, ID)''',
+        '''CREATE INDEX idx_tv_series_genre_rating ON TV_Series (Genre, Rating DESC, ID)''',
+    ],
+    # 8: movies_page ordered by year
+    [
+        '''CREATE INDEX idx_movies_service_year ON Movies (Service_ID, Year)''',
+    ],
+]
+
+# Row records returned by Service. They are plain tuples underneath, so
+# they cost no more memory than raw rows and still index positionally.
+ServiceRecord = namedtuple('ServiceRecord', 'id name price')
+Movie = namedtuple('Movie', 'id name year genre rating runtime service_id')
+Series = namedtuple('Series', 'id name genre rating')
+Season = namedtuple('Season', 'series_name season_number year episodes_number series_id')
+SearchResult = namedtuple('SearchResult', 'kind id name genre rank')
+ServiceStats = namedtuple('ServiceStats', 'service_id name price movies series seasons episodes '
+                                          'avg_rating total_runtime price_per_title')
+GenreCount = namedtuple('GenreCount', 'genre movies series')
+YearCount = namedtuple('YearCount', 'year movies seasons')
+SeriesEpisodes = namedtuple('SeriesEpisodes', 'series_id name seasons episodes')
+Change = namedtuple('Change', 'seq table op key data')
+
+
+def _record_factory(record):
+    """Build a sqlite3 row_factory that turns each row into the given record type."""
+    new = tuple.__new__
+    return lambda cursor, row: new(record, row)
+
+
+_ROW_FACTORIES = {record: _record_factory(record) for record in (ServiceRecord, Movie, Series, Season, SearchResult,
+                                                                 ServiceStats, GenreCount, YearCount, SeriesEpisodes)}
+
+
+def _serialized(method):
+    """Run a Service method that writes to the database under the write lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class Service:
-    def __init__(self, db_name):
-        """Initialize the Service class with database connection."""
+    def __init__(self, db_name, pooled=False, busy_timeout=BUSY_TIMEOUT, instrument=False, slow_query_threshold=None,
+                 result_cache=None, profile=None, read_only=False):
+        """Initialize the Service class; the database is opened on first use."""
+        if profile is not None and profile not in PROFILES:
+            raise ValueError(f"Unknown profile '{profile}'.")
         self.db_name = db_name
-        self.conn = sqlite3.connect(self.db_name)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
+        self.pooled = pooled
+        self.read_only = read_only
+        self.profile = 'replica' if read_only and profile is None else profile
+        self.busy_timeout = busy_timeout
+        self.stats = None
+        if instrument:
+            # Imported here so short-lived uninstrumented processes skip loading logging
+            from instrumentation import QueryStats
+            self.stats = QueryStats(slow_query_threshold)
+            self._instrument_methods()
+        self._local = threading.local()
+        self._connections = []
+        self._pool_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._conn = None
+        self._cursor = None
+        self._schema_lock = threading.Lock()
+        self._schema_ready = read_only
+        # Service name -> ID, most recently used last
+        self._service_ids = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.service_cache_hits = 0
+        self.service_cache_misses = 0
+        self.result_cache = result_cache
+        self._subscribers = []
+        self._subscriber_lock = threading.RLock()
+        self._notified_seq = 0
+
+    def _connect(self):
+        """Open a new connection to the database.
+
+        With read_only=True the file is opened as an immutable replica. Its
+        schema is not checked, so it must already be current and must not
+        change while the Service is open; checkpoint a WAL database before
+        copying it.
+        """
+        options = {'timeout': self.busy_timeout, 'check_same_thread': not self.pooled}
+        database = self.db_name
+        if self.read_only:
+            database = pathlib.Path(self.db_name).resolve().as_uri() + '?mode=ro&immutable=1'
+            options['uri'] = True
+        if self.stats is None:
+            conn = sqlite3.connect(database, **options)
+        else:
+            from instrumentation import InstrumentedConnection
+            conn = sqlite3.connect(database, factory=InstrumentedConnection, **options)
+            conn.stats = self.stats
+        conn.execute('''PRAGMA foreign_keys = ON''')
+        pragmas = dict(PROFILES.get(self.profile, {}))
+        if self.pooled and not self.read_only:
+            pragmas['journal_mode'] = 'WAL'
+        for name, value in pragmas.items():
+            conn.execute(f'''PRAGMA {name} = {value}''')
+        with self._pool_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _instrument_methods(self):
+        """Replace each public method on this instance with one that times its calls.
+
+        Used with instrument=True: statements, commits and method calls are
+        timed into self.stats, and statements slower than slow_query_threshold
+        seconds are logged.
+        """
+        from instrumentation import timed_method
+        for name, member in vars(Service).items():
+            if not name.startswith('_') and callable(member):
+                setattr(self, name, timed_method(self.stats, name, getattr(self, name)))
+
+    @property
+    def conn(self):
+        """The connection for the calling thread, opened on first use.
+
+        Pooled Services give every thread its own connection, so reads run
+        concurrently while writes are serialized by the write lock.
+        """
+        if not self.pooled:
+            if self._conn is None:
+                self._conn = self._connect()
+                self._check_schema(self._conn)
+            return self._conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            self._check_schema(conn)
+        return conn
+
+    def _check_schema(self, conn):
+        """Run _ensure_schema for a new connection, and close and forget the connection if it fails.
+
+        The next use then opens a fresh connection and checks the schema again,
+        rather than carrying on with a half migrated one.
+        """
+        try:
+            self._ensure_schema()
+        except BaseException:
+            if self.pooled:
+                self._local.conn = self._local.cursor = None
+            else:
+                self._conn = self._cursor = None
+            with self._pool_lock:
+                self._connections.remove(conn)
+            conn.close()
+            raise
+
+    @property
+    def cursor(self):
+        """The cursor for the calling thread."""
+        if not self.pooled:
+            if self._cursor is None:
+                self._cursor = self.conn.cursor()
+            return self._cursor
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self.conn.cursor()
+        return cursor
+
+    def _ensure_schema(self):
+        """Create or migrate the schema once, unless user_version shows it is already current."""
+        if self._schema_ready:
+            return
+        # The write lock is taken first, in the same order as transaction() and migrate()
+        with self._write_lock, self._schema_lock:
+            if self._schema_ready:
+                return
+            (version,) = self.conn.execute('''PRAGMA user_version''').fetchone()
+            if version < len(MIGRATIONS):
+                self.create_tables()
+            self._schema_ready = True
 
     def create_tables(self):
         """Create the Services table if it doesn't already exist."""
@@ -65,98 +493,329 @@ class Service:
         ''')
 
         self.conn.commit()
+        self.migrate()
+
+    @_serialized
+    def migrate(self):
+        """Apply the schema migrations this database has not seen yet."""
+        self.cursor.execute('''PRAGMA user_version''')
+        version = self.cursor.fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            self.cursor.execute('''BEGIN''')
+            try:
+                for statement in statements:
+                    self.cursor.execute(statement)
+                self.cursor.execute(f'''PRAGMA user_version = {number}''')
+            except BaseException:
+                # Leave nothing of a failed migration behind for a later commit to pick up
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def _commit(self):
+        """Commit, unless the calling thread is inside a transaction() block."""
+        if not getattr(self._local, 'depth', 0):
+            self.conn.commit()
+            self._share_service_ids(True)
+            self._notify()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group Service calls into one unit of work with a single commit.
+
+        Methods called inside the block do not commit on their own. The
+        outermost block commits when it exits, or rolls everything back if an
+        exception escapes it. Nested blocks are savepoints, so an exception
+        leaving a nested block undoes only that block's changes.
+        """
+        with self._write_lock:
+            depth = getattr(self._local, 'depth', 0)
+            cursor = self.cursor
+            if depth == 0:
+                self._local.changed = set()
+                if not self.conn.in_transaction:
+                    cursor.execute('''BEGIN''')
+            savepoint = f'unit_of_work_{depth}'
+            cursor.execute(f'''SAVEPOINT {savepoint}''')
+            self._local.depth = depth + 1
+            try:
+                yield self
+            except BaseException:
+                if self.conn.in_transaction:
+                    cursor.execute(f'''ROLLBACK TO {savepoint}''')
+                    cursor.execute(f'''RELEASE {savepoint}''')
+                if depth == 0:
+                    self.conn.rollback()
+                    self._share_service_ids(False)
+                self.invalidate_service_cache()
+                if self.result_cache is not None:
+                    self.result_cache.invalidate()
+                raise
+            else:
+                cursor.execute(f'''RELEASE {savepoint}''')
+                if depth == 0:
+                    self.conn.commit()
+                    self._share_service_ids(True)
+                    self._notify()
+            finally:
+                self._local.depth = depth
+                if depth == 0 and self.result_cache is not None:
+                    for service_id in self._local.changed:
+                        self.result_cache.invalidate(service_id)
+
+    def _changed(self, service_id=None):
+        """Drop cached listings of a service after writing to it; None means every service.
+
+        Rows that another thread was loading meanwhile are not cached (see
+        _cached). Inside a transaction() the listings are dropped again once
+        it ends, so rows cached by other threads before the commit do not
+        outlive it.
+        """
+        if self.result_cache is None:
+            return
+        self.result_cache.invalidate(service_id)
+        if getattr(self._local, 'depth', 0):
+            self._local.changed.add(service_id)
+
+    def _cached(self, kind, service_id, load):
+        """Return a service's listing from the result cache, calling load() on a miss.
+
+        The cache, passed to Service as result_cache, keeps list_movies and
+        list_series results until a write to their service invalidates them.
+        Rows loaded while another thread writes to the service are returned
+        but not cached, as they may predate that write.
+        """
+        key = (kind, service_id)
+        rows = self.result_cache.get(key)
+        if rows is None:
+            generation = self.result_cache.generation(service_id)
+            rows = tuple(load())
+            self.result_cache.put(key, service_id, rows, generation)
+        return rows
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        """A transaction() for loading many rows that rebuilds the search indexes once at the end.
+
+        The triggers keeping Movies_Search and Series_Search in sync are
+        dropped for the duration of the block and restored before it commits.
+        """
+        with self.transaction():
+            cursor = self.conn.cursor()
+            triggers = cursor.execute('''SELECT name, sql FROM sqlite_master
+                                         WHERE type = 'trigger' AND name GLOB '*_search_*'
+                                         ORDER BY name''').fetchall()
+            for name, sql in triggers:
+                cursor.execute(f'''DROP TRIGGER {name}''')
+            yield self
+            cursor.execute('''INSERT INTO Movies_Search (Movies_Search) VALUES ('rebuild')''')
+            cursor.execute('''INSERT INTO Series_Search (Series_Search) VALUES ('rebuild')''')
+            for name, sql in triggers:
+                cursor.execute(sql)
+
+    def group_commit(self, calls):
+        """Run several method calls in one transaction with a single commit.
+
+        calls is a list of (method_name, args) pairs. Each call runs in a
+        nested transaction, so one that raises is rolled back without
+        affecting the others. Returns a list of (ok, result_or_exception) pairs.
+        """
+        results = []
+        with self.transaction():
+            for method_name, args in calls:
+                try:
+                    with self.transaction():
+                        results.append((True, getattr(self, method_name)(*args)))
+                except Exception as e:
+                    results.append((False, e))
+        return results
+
+    # Service name cache
+    def _fetch(self, record, query, params=()):
+        """Run a query and return all its rows as the given record type."""
+        cursor = self.conn.cursor()
+        cursor.row_factory = _ROW_FACTORIES[record]
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+    def _service_id(self, name):
+        """Return the ID of the named service, or None if it does not exist."""
+        with self._cache_lock:
+            service_id = self._service_ids.get(name)
+            if service_id is not None:
+                self._service_ids.move_to_end(name)
+                self.service_cache_hits += 1
+                return service_id
+            self.service_cache_misses += 1
+        pending = getattr(self._local, 'service_ids', None)
+        if pending and name in pending:
+            return pending[name]
+
+        cursor = self.cursor
+        cursor.execute('''SELECT ID FROM Services WHERE Name = ?''', (name,))
+        service = cursor.fetchone()
+        if not service:
+            return None
+        if self.conn.in_transaction:
+            # The service may be this transaction's own uncommitted insert, so other threads
+            # only see it once the transaction commits
+            if pending is None:
+                pending = self._local.service_ids = {}
+            pending[name] = service[0]
+        else:
+            self._cache_service_ids({name: service[0]})
+        return service[0]
+
+    def _cache_service_ids(self, service_ids):
+        """Add committed name -> ID pairs to the service name cache."""
+        with self._cache_lock:
+            for name, service_id in service_ids.items():
+                self._service_ids[name] = service_id
+                self._service_ids.move_to_end(name)
+            while len(self._service_ids) > SERVICE_CACHE_SIZE:
+                self._service_ids.popitem(last=False)
+
+    def _share_service_ids(self, committed):
+        """Cache the service IDs the calling thread looked up in its transaction once it has ended."""
+        pending = getattr(self._local, 'service_ids', None)
+        if pending:
+            self._local.service_ids = {}
+            if committed:
+                self._cache_service_ids(pending)
+
+    def invalidate_service_cache(self, name=None):
+        """Drop one service name from the cache, or all of them."""
+        pending = getattr(self._local, 'service_ids', None)
+        with self._cache_lock:
+            if name is None:
+                self._service_ids.clear()
+                if pending:
+                    pending.clear()
+            else:
+                self._service_ids.pop(name, None)
+                if pending:
+                    pending.pop(name, None)
+
+    def service_cache_stats(self):
+        """Return hit/miss counters and the current size of the service name cache."""
+        with self._cache_lock:
+            return {'hits': self.service_cache_hits,
+                    'misses': self.service_cache_misses,
+                    'size': len(self._service_ids)}
 
     # Manage Services functions
+    @_serialized
     def add_service(self, name, price):
         """Insert a new service into the Services table."""
-        self.cursor.execute('''SELECT ID FROM Services WHERE Name = ?''', (name,))
-        service = self.cursor.fetchone()
-
-        if not service:
+        if self._service_id(name) is None:
             insert_query = '''INSERT INTO Services (Name, Price) 
                               VALUES (?, ?)'''
             self.cursor.execute(insert_query, (name, price))
-            self.conn.commit()
+            self._commit()
+            self.invalidate_service_cache(name)
             print(f"Service '{name}' added to database.")
         else:
             print(f"Service '{name}' already exists.")
 
+    @_serialized
     def remove_service(self, name):
         """Remove a service from the Services table."""
-        self.cursor.execute('''SELECT ID FROM Services WHERE Name = ?''', (name,))
-        service = self.cursor.fetchone()
-        if service:
-            delete_query = '''DELETE FROM Services WHERE Name = ?'''
-            self.cursor.execute(delete_query, (name,))
-            self.conn.commit()
+        service_id = self._service_id(name)
+        if service_id is not None:
+            # Series links and seasons go with the service through ON DELETE CASCADE
+            with self.transaction():
+                self.cursor.execute('''DELETE FROM Movies WHERE Service_ID = ?''', (service_id,))
+                delete_query = '''DELETE FROM Services WHERE Name = ?'''
+                self.cursor.execute(delete_query, (name,))
+            self.invalidate_service_cache(name)
+            self._changed(service_id)
             print(f"Service '{name}' was removed from the database.")
         else:
             print(f"Service '{name}' was not found.")
 
     def list_services(self):
         """List all services in the database."""
-        select_query = '''SELECT * FROM Services'''
-        self.cursor.execute(select_query)
-        services = self.cursor.fetchall()
-        if not services:
+        found = False
+        for service in self.iter_services():
+            found = True
+            print(f"Name: {service.name}, Price: {service.price}")
+        if not found:
             print("No services available.")
+
+    def services_page(self, after=None, page_size=LIST_PAGE_SIZE):
+        """Return a page of services ordered by ID and the cursor for the next page.
+
+        Pass the returned cursor as after to get the following page; it is
+        None once the last page has been returned.
+        """
+        if after is None:
+            services = self._fetch(ServiceRecord, '''SELECT * FROM Services ORDER BY ID LIMIT ?''', (page_size,))
         else:
-            for service in services:
-                print(f"Name: {service[1]}, Price: {service[2]}")
+            services = self._fetch(ServiceRecord, '''SELECT * FROM Services WHERE ID > ? ORDER BY ID LIMIT ?''',
+                                   (after, page_size))
+        if len(services) < page_size:
+            return services, None
+        return services, services[-1].id
+
+    def iter_services(self, page_size=LIST_PAGE_SIZE):
+        """Yield all services, fetching them a page at a time."""
+        after = None
+        while True:
+            services, after = self.services_page(after, page_size)
+            yield from services
+            if after is None:
+                return
 
     # Manage Movies functions
+    @_serialized
     def add_movie(self, service_name, name, year, genre, rating, runtime):
         """Add a movie to a specific service."""
         # First, find the Service_ID for the given service name
-        self.cursor.execute('''SELECT ID FROM Services WHERE Name = ?''', (service_name,))
-        service = self.cursor.fetchone()
+        service_id = self._service_id(service_name)
 
-        if service:
-            # Get the Service_ID
-            service_id = service[0]
+        if service_id is not None:
             try:
                 insert_query = '''INSERT INTO Movies (Name, Year, Genre, Rating, Runtime, Service_ID) 
                                   VALUES (?, ?, ?, ?, ?, ?)'''
                 self.cursor.execute(insert_query, (name, year, genre, rating, runtime, service_id))
-                self.conn.commit()
+                self._commit()
+                self._changed(service_id)
                 print(f"Movie '{name}' added to service '{service_name}'.")
             except sqlite3.IntegrityError:
                 print("Incorrect values entered. Please try again.")
         else:
             print(f"Service '{service_name}' not found.")
 
+    @_serialized
     def remove_movie(self, service_name, movie_name):
         """Remove a movie from a specific service."""
         if service_name and movie_name:
-            delete_query = '''DELETE FROM Movies WHERE Name = ?'''
-            self.cursor.execute(delete_query, (movie_name,))
-            self.conn.commit()
+            service_id = self._service_id(service_name)
+            delete_query = '''DELETE FROM Movies WHERE Name = ? AND Service_ID = ?'''
+            self.cursor.execute(delete_query, (movie_name, service_id))
+            self._commit()
+            self._changed(service_id)
             print(f"Movie '{movie_name}' was successfully removed from the service.")
         else:
             print(f"Movie '{movie_name}' not found.")
 
+    @_serialized
     def edit_ranking(self, service_name, movie_name, rating):
         if service_name and movie_name:
-            insert_query = '''UPDATE Movies SET Rating = ? WHERE Name = ?'''
-            self.cursor.execute(insert_query, (rating, movie_name))
-            self.conn.commit()
+            service_id = self._service_id(service_name)
+            insert_query = '''UPDATE Movies SET Rating = ? WHERE Name = ? AND Service_ID = ?'''
+            self.cursor.execute(insert_query, (rating, movie_name, service_id))
+            self._commit()
+            self._changed(service_id)
             print(f"Movie '{movie_name}' rating set to {rating}.")
         else:
             print(f"Movie '{movie_name}' not found.")
 
     def name_check(self, service_name):
-        self.cursor.execute('''SELECT ID FROM Services WHERE Name = ?''', (service_name,))
-        service = self.cursor.fetchone()
-        if not service:
-            return False
-        else:
-            return True
+        return self._service_id(service_name) is not None
 
     def movie_check(self, service_name, movie_name):
-        self.cursor.execute('''SELECT ID FROM Services WHERE Name = ?''', (service_name,))
-        service = self.cursor.fetchone()
-
-        service_id = service[0]
+        service_id = self._service_id(service_name)
 
         # Now, check if the movie exists for the current service
         self.cursor.execute('''SELECT Name FROM Movies WHERE Service_ID = ? AND Name = ?''', (service_id, movie_name))
@@ -178,77 +837,178 @@ class Service:
         else:
             return True
 
+    def _check_keys(self, query, keys, chunk_size):
+        """Split keys into those query finds and those it does not, looking them up chunk_size at a time.
+
+        query selects the columns of the Keys table that match the catalog,
+        Keys being a VALUES list written as {values} that each chunk of keys
+        is bound to. Selecting them from Keys rather than from the catalog
+        returns each key as the caller wrote it, so ('M', '2000') is found
+        like ('M', 2000).
+        """
+        keys = set(keys)
+        pending = list(keys)
+        existing = set()
+        cursor = self.conn.cursor()
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            values = ', '.join(['(?, ?)'] * len(chunk))
+            cursor.execute(query.format(values=values), [value for key in chunk for value in key])
+            existing.update(cursor.fetchall())
+        return existing, keys - existing
+
+    def check_movies(self, keys, chunk_size=CHECK_CHUNK_SIZE):
+        """Return (existing, missing): the (name, year) keys that are and are not in the catalog."""
+        return self._check_keys('''WITH Keys (Name, Year) AS (VALUES {values})
+                                   SELECT DISTINCT Keys.Name, Keys.Year FROM Keys
+                                   JOIN Movies ON Movies.Name = Keys.Name AND Movies.Year = Keys.Year''',
+                                keys, chunk_size)
+
     def list_movies(self, service_name):
         """List all movies for a specific service."""
-        self.cursor.execute('''SELECT ID FROM Services WHERE Name = ?''', (service_name,))
-        service = self.cursor.fetchone()
-
-        if service:
-            service_id = service[0]
-            select_query = '''SELECT * FROM Movies WHERE Service_ID = ?'''
-            self.cursor.execute(select_query, (service_id,))
-            movies = self.cursor.fetchall()
-            if not movies:
-                print(f"No movies found for service '{service_name}'.")
+        service_id = self._service_id(service_name)
+
+        if service_id is not None:
+            if self.result_cache is None:
+                movies = self.iter_movies(service_name)
             else:
-                for movie in movies:
-                    print(
-                        f"Movie Name: {movie[1]}, Year: {movie[2]}, Genre: {movie[3]}, Rating: {movie[4]}, Runtime: {movie[5]}")
+                movies = self._cached('list_movies', service_id, lambda: self.iter_movies(service_name))
+            found = False
+            for movie in movies:
+                found = True
+                print(f"Movie Name: {movie.name}, Year: {movie.year}, Genre: {movie.genre}, Rating: {movie.rating}, "
+                      f"Runtime: {movie.runtime}")
+            if not found:
+                print(f"No movies found for service '{service_name}'.")
             return True
         else:
             print(f"Service '{service_name}' not found.")
             return False
 
+    def movies_page(self, service_name, after=None, page_size=LIST_PAGE_SIZE, genre=None, year_from=None,
+                    year_to=None, min_rating=None, max_rating=None, order_by='id', descending=False):
+        """Return a page of a service's movies and the cursor for the next page.
+
+        Movies can be filtered by genre, year range and rating range, and
+        ordered by 'id', 'name', 'year' or 'rating'. Movies without a year or
+        rating come first in ascending order and last in descending order.
+        Pass the returned cursor as after to get the following page; it is
+        None once the last page has been returned or if the service does not
+        exist.
+        """
+        service_id = self._service_id(service_name)
+        if service_id is None:
+            return [], None
+        column, position, reverse_ties = MOVIE_ORDERS[order_by]
+
+        conditions = ['''Service_ID = ?''']
+        params = [service_id]
+        for condition, value in (('Genre = ?', genre), ('Year >= ?', year_from), ('Year <= ?', year_to),
+                                 ('Rating >= ?', min_rating), ('Rating <= ?', max_rating)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        direction, compare = ('DESC', '<') if descending else ('ASC', '>')
+        id_direction, id_compare = direction, compare
+        if reverse_ties:
+            id_direction, id_compare = ('ASC', '>') if descending else ('DESC', '<')
+        order_clause = f'''ID {direction}''' if order_by == 'id' else f'''{column} {direction}, ID {id_direction}'''
+
+        # Keyset conditions for the rest of the ordering, each read as one index range. NULLs sort
+        # below every value, so the rows on the far side of them are read as a second range.
+        if after is None:
+            ranges = [([], [])]
+        elif order_by == 'id':
+            ranges = [([f'''ID {compare} ?'''], [after[1]])]
+        elif after[0] is None:
+            ranges = [([f'''{column} IS NULL''', f'''ID {id_compare} ?'''], [after[1]])]
+            if not descending:
+                ranges.append(([f'''{column} IS NOT NULL'''], []))
+        else:
+            ranges = [([f'''{column} {compare}= ?''', f'''({column} {compare} ? OR ID {id_compare} ?)'''],
+                       [after[0], after[0], after[1]])]
+            if descending:
+                ranges.append(([f'''{column} IS NULL'''], []))
+
+        movies = []
+        for keyset, keyset_params in ranges:
+            movies += self._fetch(Movie, f'''SELECT * FROM Movies WHERE {' AND '.join(conditions + keyset)}
+                                            ORDER BY {order_clause} LIMIT ?''',
+                                  params + keyset_params + [page_size - len(movies)])
+            if len(movies) == page_size:
+                break
+        if len(movies) < page_size:
+            return movies, None
+        last = movies[-1]
+        return movies, (last[position], last.id)
+
+    def iter_movies(self, service_name, page_size=LIST_PAGE_SIZE, **filters):
+        """Yield a service's movies a page at a time; takes the same filters as movies_page."""
+        after = None
+        while True:
+            movies, after = self.movies_page(service_name, after, page_size, **filters)
+            yield from movies
+            if after is None:
+                return
+
     def get_service_id(self, service_name):
-        self.cursor.execute('''SELECT ID FROM Services WHERE Name=?''', (service_name,))
-        service = self.cursor.fetchone()
-        if service:
-            service_id = service[0]
+        service_id = self._service_id(service_name)
+        if service_id is not None:
             return service_id
         return False
 
     # Manage TV_Series functions
+    def _series_id(self, series_name):
+        """Return the ID of the named series, or None if it does not exist."""
+        self.cursor.execute('''SELECT ID FROM TV_Series WHERE Name = ?''', (series_name,))
+        series = self.cursor.fetchone()
+        if series:
+            return series[0]
+        return None
+
+    @_serialized
     def add_series(self, service_name, series_name, genre, rating):
         """Add TV_Series to a specific server"""
         service_id = self.get_service_id(service_name)
         if service_id:
-            # check if exists in TV_Series table
-            self.cursor.execute('''SELECT * FROM TV_Series WHERE Name =?''', (series_name,))
-            exists = self.cursor.fetchone()
-            if not exists:
-                self.cursor.execute('''INSERT INTO TV_Series (Name, Genre, Rating) VALUES (?, ?, ?)''',
-                                    (series_name, genre, rating))
-                self.conn.commit()
-
-            # insert data into linked table (does not matter if tv_series already existed in the system)
-            self.cursor.execute('''INSERT INTO Series_Service (Series_Name, Service_Name) VALUES (?,?)''',
-                                (series_name, service_name))
-            self.conn.commit()
+            with self.transaction():
+                # check if exists in TV_Series table
+                series_id = self._series_id(series_name)
+                if series_id is None:
+                    self.cursor.execute('''INSERT INTO TV_Series (Name, Genre, Rating) VALUES (?, ?, ?)''',
+                                        (series_name, genre, rating))
+                    series_id = self.cursor.lastrowid
+
+                # insert data into linked table (does not matter if tv_series already existed in the system)
+                self.cursor.execute('''INSERT INTO Series_Service (Series_ID, Service_ID) VALUES (?,?)''',
+                                    (series_id, service_id))
             return f"{series_name} was successfully added to {service_name}"
         return "Service not found"
 
     # remove series from all the services
+    @_serialized
     def remove_series(self, service_name, series_name):
         """Remove TV_Series from a specific server"""
         service_id = self.get_service_id(service_name)
         if service_id:
-            self.cursor.execute('''SELECT * FROM Series_Service WHERE Series_Name =? AND Service_Name=?''',
-                                (series_name, service_name))
-            exists = self.cursor.fetchall()
+            series_id = self._series_id(series_name)
+            self.cursor.execute('''SELECT * FROM Series_Service WHERE Series_ID =? AND Service_ID=?''',
+                                (series_id, service_id))
+            exists = self.cursor.fetchone()
             if exists:
-                self.cursor.execute('''DELETE FROM Series_Service WHERE Series_Name =? AND Service_Name=?''',
-                                    (series_name, service_name))
-                self.cursor.execute('''DELETE FROM Season WHERE Series_Name =? AND Service_Name=?''',
-                                    (series_name, service_name))
-                self.conn.commit()
-
-                # check if any other  service has series available, if not remove series from tv_series table
-                self.cursor.execute('''SELECT * FROM Series_Service WHERE Series_Name=? AND Service_Name=?''',
-                                    (series_name, service_name))
-                series_left = self.cursor.fetchall()
-                if not series_left:
-                    self.cursor.execute('''DELETE FROM TV_Series WHERE Name=?''', (series_name,))
-                    self.conn.commit()
+                with self.transaction():
+                    self.cursor.execute('''DELETE FROM Series_Service WHERE Series_ID =? AND Service_ID=?''',
+                                        (series_id, service_id))
+                    self.cursor.execute('''DELETE FROM Season WHERE Series_ID =? AND Service_ID=?''',
+                                        (series_id, service_id))
+
+                    # check if any other  service has series available, if not remove series from tv_series table
+                    self.cursor.execute('''SELECT * FROM Series_Service WHERE Series_ID=?''', (series_id,))
+                    series_left = self.cursor.fetchone()
+                    if not series_left:
+                        self.cursor.execute('''DELETE FROM TV_Series WHERE ID=?''', (series_id,))
+                self._changed(service_id)
                 return f"{series_name} was successfully removed from the system"
 
             else:
@@ -256,85 +1016,636 @@ class Service:
 
         return "Service not found"
 
+    @_serialized
     def remove_series_from_service(self, series_name, service_name):
-        service_id = self.get_service_id
+        service_id = self.get_service_id(service_name)
         if service_id:
             # check if series exist at this service
-            self.cursor.execute('''SELECT * FROM Series_Service WHERE Series_Name =? AND Service_Name =?''',
-                                (series_name, service_name))
+            series_id = self._series_id(series_name)
+            self.cursor.execute('''SELECT * FROM Series_Service WHERE Series_ID =? AND Service_ID =?''',
+                                (series_id, service_id))
             series_service_exist = self.cursor.fetchone()
             if series_service_exist:
-                self.cursor.execute('''DELETE FROM Series_Service WHERE Series_Name=? AND Service_Name =?''',
-                                    (series_name, service_name))
-                self.cursor.execute('''DELETE FROM Season WHERE Series_Name =? AND Service_Name =?''',
-                                    (series_name, service_name))
-                self.conn.commit()
+                self.cursor.execute('''DELETE FROM Series_Service WHERE Series_ID=? AND Service_ID =?''',
+                                    (series_id, service_id))
+                self.cursor.execute('''DELETE FROM Season WHERE Series_ID =? AND Service_ID =?''',
+                                    (series_id, service_id))
+                self._commit()
+                self._changed(service_id)
+                return f"{series_name} was removed from {service_name}."
             else:
                 return f"{series_name} does not exist on {service_name}."
         return "Service not found"
 
+    @_serialized
     def add_season(self, service_name, series_name, season_number, year, episodes_number):
         service_id = self.get_service_id(service_name)
         # check if service exists
         if service_id:
             # check if there are no other records of series_name AND season_number
-            self.cursor.execute('''SELECT * FROM Season WHERE Series_Name =? AND Season_Number =?''',
-                                (series_name, season_number))
+            series_id = self._series_id(series_name)
+            self.cursor.execute('''SELECT Services.Name FROM Season JOIN Services ON Services.ID = Season.Service_ID
+                                   WHERE Series_ID =? AND Season_Number =?''', (series_id, season_number))
             exists = self.cursor.fetchone()
             if not exists:
                 # check if series were added to service_name already
-                self.cursor.execute('''SELECT * FROM Series_Service WHERE Series_Name =? AND Service_Name =?''',
-                                    (series_name, service_name))
+                self.cursor.execute('''SELECT * FROM Series_Service WHERE Series_ID =? AND Service_ID =?''',
+                                    (series_id, service_id))
                 series_service_exist = self.cursor.fetchone()
                 if series_service_exist:
                     self.cursor.execute(
-                        '''INSERT INTO Season (Series_Name, Season_Number, Year, Episodes_Number, Service_Name) VALUES (?,?,?,?,?)''',
-                        (series_name, season_number, year, episodes_number, service_name))
-                    self.conn.commit()
+                        '''INSERT INTO Season (Series_ID, Season_Number, Year, Episodes_Number, Service_ID) VALUES (?,?,?,?,?)''',
+                        (series_id, season_number, year, episodes_number, service_id))
+                    self._commit()
+                    self._changed(service_id)
                     return f"{series_name} season {season_number} was successfully added to {service_name}"
                 return f"{series_name} was not found on {service_name}. To add season to series make sure to add series to the service beforehand."
             else:
-                season_service = exists[4]
+                season_service = exists[0]
                 return f"{series_name} season {season_number} already exists on {season_service}."
         return f"{service_name} does not exist on the system."
 
+    @_serialized
     def remove_season(self, series_name, season_number):
-        self.cursor.execute('''SELECT * FROM Season WHERE Series_Name=? AND Season_Number=?''',
-                            (series_name, season_number))
+        series_id = self._series_id(series_name)
+        self.cursor.execute('''SELECT * FROM Season WHERE Series_ID=? AND Season_Number=?''',
+                            (series_id, season_number))
         exists = self.cursor.fetchone()
         if exists:
-            self.cursor.execute('''DELETE FROM Season WHERE Series_Name=? AND Season_Number=?''',
-                                (series_name, season_number))
-            self.conn.commit()
+            self.cursor.execute('''DELETE FROM Season WHERE Series_ID=? AND Season_Number=?''',
+                                (series_id, season_number))
+            self._commit()
+            self._changed(exists[4])
             return f"Season {season_number} was successfully removed."
         return f"Season {season_number} is not on the system."
 
+    def check_seasons(self, keys, chunk_size=CHECK_CHUNK_SIZE):
+        """Return (existing, missing): the (series name, season number) keys that are and are not in the catalog."""
+        return self._check_keys('''WITH Keys (Name, Number) AS (VALUES {values})
+                                   SELECT Keys.Name, Keys.Number FROM Keys
+                                   JOIN TV_Series ON TV_Series.Name = Keys.Name
+                                   JOIN Season ON Season.Series_ID = TV_Series.ID
+                                               AND Season_Number = Keys.Number''', keys, chunk_size)
+
+    @_serialized
     def add_ranking_series(self, series_name, rating):
-        self.cursor.execute('''SELECT * FROM TV_Series WHERE Name =?''')
+        self.cursor.execute('''SELECT * FROM TV_Series WHERE Name =?''', (series_name,))
         exists = self.cursor.fetchone()
         if exists:
             self.cursor.execute('''UPDATE TV_Series SET Rating =? WHERE Name =?''', (rating, series_name))
+            self._commit()
             return f"Rating for {series_name} was set to {rating}."
         return f"Series {series_name} was not found."
 
     def list_series(self, service):
         # list all the seasons of a series
-        self.cursor.execute('''SELECT Series_Name, Season_Number, Year, Episodes_Number FROM Season WHERE Service_Name = ?''', (service,))
-        lst_series = self.cursor.fetchall()
+        service_id = self._service_id(service)
+
+        def load():
+            return self._fetch(Season, '''SELECT TV_Series.Name, Season_Number, Season.Year, Episodes_Number, Series_ID
+                                          FROM Season JOIN TV_Series ON TV_Series.ID = Season.Series_ID
+                                          WHERE Season.Service_ID = ?''', (service_id,))
+
+        if self.result_cache is None:
+            lst_series = load()
+        else:
+            lst_series = list(self._cached('list_series', service_id, load))
         if lst_series:
-            result = []
-            for series in lst_series:
-                result.append(series)
-            return result
+            return lst_series
         return f"{service} has no TV_Series available."
 
+    def seasons_page(self, service, after=None, page_size=LIST_PAGE_SIZE, year_from=None, year_to=None):
+        """Return a page of a service's seasons and the cursor for the next page.
+
+        Seasons are ordered by series ID and season number, optionally
+        filtered by a year range. Pass the returned cursor as after to get the
+        following page; it is None once the last page has been returned.
+        """
+        conditions = ['''Season.Service_ID = ?''']
+        params = [self._service_id(service)]
+        for condition, value in (('Season.Year >= ?', year_from), ('Season.Year <= ?', year_to)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if after is not None:
+            conditions.append('''(Series_ID, Season_Number) > (?, ?)''')
+            params.extend(after)
+        params.append(page_size)
+
+        seasons = self._fetch(Season, f'''SELECT TV_Series.Name, Season_Number, Season.Year, Episodes_Number, Series_ID
+                                          FROM Season JOIN TV_Series ON TV_Series.ID = Season.Series_ID
+                                          WHERE {' AND '.join(conditions)}
+                                          ORDER BY Series_ID, Season_Number LIMIT ?''', params)
+        if len(seasons) < page_size:
+            return seasons, None
+        return seasons, (seasons[-1].series_id, seasons[-1].season_number)
+
+    def iter_seasons(self, service, page_size=LIST_PAGE_SIZE, **filters):
+        """Yield a service's seasons a page at a time; takes the same filters as seasons_page."""
+        after = None
+        while True:
+            seasons, after = self.seasons_page(service, after, page_size, **filters)
+            yield from seasons
+            if after is None:
+                return
+
+    # Search functions
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Search movie and series names and genres, best matches first.
+
+        Every word of the query must match the start of a word in the name or
+        genre, so 'star wa' finds 'Star Wars'. Returns SearchResult records
+        whose kind is 'movie' or 'series'; a lower rank is a better match.
+        """
+        words = re.findall(r'\w+', query)
+        if not words:
+            return []
+        match = ' '.join(f'"{word}"*' for word in words)
+        return self._fetch(SearchResult, '''
+            SELECT * FROM (SELECT 'movie', rowid, Name, Genre, rank FROM Movies_Search
+                           WHERE Movies_Search MATCH ? ORDER BY rank LIMIT ?)
+            UNION ALL
+            SELECT * FROM (SELECT 'series', rowid, Name, Genre, rank FROM Series_Search
+                           WHERE Series_Search MATCH ? ORDER BY rank LIMIT ?)
+            ORDER BY 5 LIMIT ?''', (match, limit, match, limit, limit))
+
+    # Analytics functions
+    def service_stats(self, service_name=None, live=False):
+        """Return ServiceStats totals for one service, or for every service if service_name is None.
+
+        The totals are read from the trigger-maintained Service_Stats table;
+        with live=True they are recomputed from the catalog with GROUP BY
+        instead. avg_rating is over rated movies and price_per_title is the
+        service price divided by its movies plus series.
+        """
+        params = () if service_name is None else (self._service_id(service_name),)
+        if not live:
+            where = '' if service_name is None else 'WHERE Services.ID = ?'
+            return self._fetch(ServiceStats, f'''
+                SELECT Services.ID, Name, Price, Movies, Series, Seasons, Episodes,
+                       CAST(Rating_Sum AS REAL) / NULLIF(Rated_Movies, 0), Runtime_Sum,
+                       CAST(Price AS REAL) / NULLIF(Movies + Series, 0)
+                FROM Services JOIN Service_Stats ON Service_Stats.Service_ID = Services.ID
+                {where} ORDER BY Services.ID''', params)
+
+        where = '' if service_name is None else 'WHERE Service_ID = ?'
+        return self._fetch(ServiceStats, f'''
+            SELECT Services.ID, Name, Price, COALESCE(Movies, 0), COALESCE(Series, 0), COALESCE(Seasons, 0),
+                   COALESCE(Episodes, 0), Avg_Rating, COALESCE(Runtime, 0),
+                   CAST(Price AS REAL) / NULLIF(COALESCE(Movies, 0) + COALESCE(Series, 0), 0)
+            FROM Services
+            LEFT JOIN (SELECT Service_ID, COUNT(*) AS Movies, AVG(Rating) AS Avg_Rating, SUM(Runtime) AS Runtime
+                       FROM Movies {where} GROUP BY Service_ID) AS M ON M.Service_ID = Services.ID
+            LEFT JOIN (SELECT Service_ID, COUNT(*) AS Series
+                       FROM Series_Service {where} GROUP BY Service_ID) AS L ON L.Service_ID = Services.ID
+            LEFT JOIN (SELECT Service_ID, COUNT(*) AS Seasons, SUM(Episodes_Number) AS Episodes
+                       FROM Season {where} GROUP BY Service_ID) AS S ON S.Service_ID = Services.ID
+            {where.replace('Service_ID', 'Services.ID')} ORDER BY Services.ID''', params * 4)
+
+    def genre_histogram(self, service_name=None):
+        """Return GenreCount rows of movies and series per genre, most common genre first."""
+        if service_name is None:
+            movies, series, params = '''Movies''', '''TV_Series''', ()
+        else:
+            service_id = self._service_id(service_name)
+            movies = '''Movies WHERE Service_ID = ?'''
+            series = '''Series_Service JOIN TV_Series ON TV_Series.ID = Series_ID WHERE Service_ID = ?'''
+            params = (service_id, service_id)
+        return self._fetch(GenreCount, f'''
+            SELECT Genre, SUM(Kind = 'movie'), SUM(Kind = 'series') FROM (
+                SELECT Genre, 'movie' AS Kind FROM {movies}
+                UNION ALL
+                SELECT Genre, 'series' FROM {series})
+            GROUP BY Genre ORDER BY COUNT(*) DESC, Genre''', params)
+
+    def year_distribution(self, service_name=None):
+        """Return YearCount rows of movies and seasons released per year, in year order."""
+        where, params = '''WHERE Year IS NOT NULL''', ()
+        if service_name is not None:
+            service_id = self._service_id(service_name)
+            where, params = '''WHERE Year IS NOT NULL AND Service_ID = ?''', (service_id, service_id)
+        return self._fetch(YearCount, f'''
+            SELECT Year, SUM(Movie), SUM(Season) FROM (
+                SELECT Year, 1 AS Movie, 0 AS Season FROM Movies {where}
+                UNION ALL
+                SELECT Year, 0, 1 FROM Season {where})
+            GROUP BY Year ORDER BY Year''', params)
+
+    def episodes_per_series(self, service_name):
+        """Return SeriesEpisodes rows with the season and episode count of each series on a service."""
+        return self._fetch(SeriesEpisodes, '''
+            SELECT Series_Service.Series_ID, TV_Series.Name, COUNT(Season.Series_ID),
+                   COALESCE(SUM(Episodes_Number), 0)
+            FROM Series_Service JOIN TV_Series ON TV_Series.ID = Series_Service.Series_ID
+            LEFT JOIN Season ON Season.Series_ID = Series_Service.Series_ID
+                            AND Season.Service_ID = Series_Service.Service_ID
+            WHERE Series_Service.Service_ID = ?
+            GROUP BY Series_Service.Series_ID ORDER BY Series_Service.Series_ID''',
+                           (self._service_id(service_name),))
+
+    # Bulk import functions
+    @_serialized
+    def bulk_import(self, rows, batch_size=IMPORT_BATCH_SIZE):
+        """Import services, movies, series and seasons in a single transaction.
+
+        Each row is a dict with a 'type' key ('service', 'movie', 'series' or
+        'season') and the matching columns. Returns a list of
+        (row_number, type, name, status, message) tuples, status being
+        'added', 'conflict' or 'error'.
+        """
+        with self.transaction():
+            importer = _BulkImport(self, batch_size)
+            for row_number, row in enumerate(rows, start=1):
+                importer.add(row_number, row)
+            importer.flush()
+        self._changed()
+        importer.report.sort()
+        return importer.report
+
+    # Ranking functions
+    def top_movies(self, service_name=None, genre=None, limit=TOP_LIMIT):
+        """Return the limit best rated movies of a service, of a genre, of both, or across every service.
+
+        Ties are broken by ID and unrated movies come last.
+        """
+        conditions, params = [], []
+        if service_name is not None:
+            conditions.append('''Service_ID = ?''')
+            params.append(self._service_id(service_name))
+        if genre is not None:
+            conditions.append('''Genre = ?''')
+            params.append(genre)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return self._fetch(Movie, f'''SELECT * FROM Movies {where} ORDER BY Rating DESC, ID LIMIT ?''',
+                           params + [limit])
+
+    def top_series(self, service_name=None, genre=None, limit=TOP_LIMIT):
+        """Return the limit best rated series of a service, of a genre, of both, or across every service."""
+        if service_name is None:
+            where = '''WHERE Genre = ?''' if genre is not None else ''''''
+            params = [genre] if genre is not None else []
+            return self._fetch(Series, f'''SELECT * FROM TV_Series {where} ORDER BY Rating DESC, ID LIMIT ?''',
+                               params + [limit])
+        conditions, params = ['''Series_Service.Service_ID = ?'''], [self._service_id(service_name)]
+        if genre is not None:
+            conditions.append('''Genre = ?''')
+            params.append(genre)
+        return self._fetch(Series, f'''SELECT TV_Series.* FROM Series_Service
+                                        JOIN TV_Series ON TV_Series.ID = Series_Service.Series_ID
+                                        WHERE {' AND '.join(conditions)}
+                                        ORDER BY Rating DESC, TV_Series.ID LIMIT ?''', params + [limit])
+
+    def similar_movies(self, service_name, movie_name, limit=TOP_LIMIT, years=SIMILAR_YEARS):
+        """Return the best rated movies of the same genre released within years of the given movie.
+
+        Returns an empty list if the movie is not on the service.
+        """
+        movie = self._fetch(Movie, '''SELECT * FROM Movies WHERE Service_ID = ? AND Name = ? LIMIT 1''',
+                            (self._service_id(service_name), movie_name))
+        if not movie or movie[0].year is None:
+            return []
+        movie = movie[0]
+        return self._fetch(Movie, '''SELECT * FROM Movies
+                                     WHERE Genre = ? AND Year BETWEEN ? AND ? AND ID != ?
+                                     ORDER BY Rating DESC, ABS(Year - ?), ID LIMIT ?''',
+                           (movie.genre, movie.year - years, movie.year + years, movie.id, movie.year, limit))
+
+    # Change log functions
+    def changes(self, since=0, limit=CHANGES_LIMIT):
+        """Return up to limit Change records logged after sequence number since, oldest first.
+
+        key and data are dicts of column values; data is None for deletes.
+        Pass the seq of the last record returned as since to read the next
+        batch.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''SELECT Seq, Table_Name, Op, Row_Key, Row_Data FROM Change_Log
+                          WHERE Seq > ? ORDER BY Seq LIMIT ?''', (since, limit))
+        return [Change(seq, table, op, json.loads(key), None if data is None else json.loads(data))
+                for seq, table, op, key, data in cursor.fetchall()]
+
+    def last_change_seq(self):
+        """Return the sequence number of the newest logged change, 0 if there has been none.
+
+        Trimmed changes still count, so the number never goes back.
+        """
+        return self.conn.execute('''SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'Change_Log'), 0)'''
+                                 ).fetchone()[0]
+
+    @_serialized
+    def trim_changes(self, upto):
+        """Delete logged changes up to and including sequence number upto, once every consumer has read them.
+
+        Snapshots whose watermark is below upto can no longer be followed by
+        an incremental export; export_snapshot refuses them and a full
+        snapshot has to be taken instead.
+        """
+        self.cursor.execute('''DELETE FROM Change_Log WHERE Seq <= ?''', (upto,))
+        self._commit()
+
+    def subscribe(self, callback):
+        """Call callback(changes) with the new Change records after every commit made through this Service.
+
+        Changes committed by other connections are delivered with the next
+        local commit.
+        """
+        with self._subscriber_lock:
+            if not self._subscribers:
+                self._notified_seq = self.last_change_seq()
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._subscriber_lock:
+            self._subscribers.remove(callback)
+
+    def _notify(self):
+        if not self._subscribers:
+            return
+        with self._subscriber_lock:
+            changes = self.changes(self._notified_seq, -1)
+            if not changes:
+                return
+            self._notified_seq = changes[-1].seq
+            for callback in list(self._subscribers):
+                callback(changes)
+
     def close(self):
         """Close the database connection."""
-        self.conn.close()
+        with self._pool_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._conn = None
+        self._cursor = None
+
+
+class _BulkImport:
+    """Validates import rows against the database and inserts them in batches."""
+
+    def __init__(self, service, batch_size):
+        self.cursor = service.cursor
+        self.batch_size = batch_size
+        self.report = []
+
+        # Resolve everything the rows are checked against once, up front
+        self.services = dict(self.cursor.execute('''SELECT Name, ID FROM Services'''))
+        self.movies = set(self.cursor.execute('''SELECT Name, Year FROM Movies'''))
+        self.series = {name for name, in self.cursor.execute('''SELECT Name FROM TV_Series''')}
+        self.links = set(self.cursor.execute('''
+            SELECT TV_Series.Name, Services.Name FROM Series_Service
+            JOIN TV_Series ON TV_Series.ID = Series_Service.Series_ID
+            JOIN Services ON Services.ID = Series_Service.Service_ID'''))
+        self.seasons = {(series_name, season_number): service_name for series_name, season_number, service_name
+                        in self.cursor.execute('''
+            SELECT TV_Series.Name, Season.Season_Number, Services.Name FROM Season
+            JOIN TV_Series ON TV_Series.ID = Season.Series_ID
+            JOIN Services ON Services.ID = Season.Service_ID''')}
+
+        self.pending_series = []
+        self.pending_links = []
+        self.pending_movies = []
+        self.pending_seasons = []
+
+    def add(self, row_number, row):
+        if not isinstance(row, dict):
+            self.report.append((row_number, None, None, 'error', "Invalid JSON."))
+            return
+        kind = row.get('type')
+        try:
+            values = validate_import_row(row)
+        except ValueError as e:
+            # Rejected before its key is reserved, so a later valid row with the same key is still added
+            self.report.append((row_number, kind, row.get('name') or row.get('series'), 'error', str(e)))
+        else:
+            getattr(self, f'add_{kind}')(row_number, *values)
+
+        pending = len(self.pending_series) + len(self.pending_links) + len(self.pending_movies) + len(self.pending_seasons)
+        if pending >= self.batch_size:
+            self.flush()
+
+    def add_service(self, row_number, name, price):
+        if name in self.services:
+            self.report.append((row_number, 'service', name, 'conflict', f"Service '{name}' already exists."))
+            return
+        try:
+            self.cursor.execute('''INSERT INTO Services (Name, Price) VALUES (?, ?)''', (name, price))
+        except sqlite3.IntegrityError as e:
+            self.report.append((row_number, 'service', name, 'error', str(e)))
+            return
+        self.services[name] = self.cursor.lastrowid
+        self.report.append((row_number, 'service', name, 'added', f"Service '{name}' added to database."))
+
+    def add_movie(self, row_number, service_name, name, year, genre, rating, runtime):
+        service_id = self.services.get(service_name)
+        if not service_id:
+            self.report.append((row_number, 'movie', name, 'error', f"Service '{service_name}' not found."))
+        elif (name, year) in self.movies:
+            self.report.append((row_number, 'movie', name, 'conflict', "Movie already exists."))
+        else:
+            self.movies.add((name, year))
+            params = (name, year, genre, rating, runtime, service_id)
+            self.pending_movies.append((row_number, 'movie', name, (name, year), params))
+
+    def add_series(self, row_number, service_name, name, genre, rating):
+        if service_name not in self.services:
+            self.report.append((row_number, 'series', name, 'error', "Service not found"))
+        elif (name, service_name) in self.links:
+            self.report.append((row_number, 'series', name, 'conflict', f"{name} already exists on {service_name}."))
+        else:
+            if name not in self.series:
+                self.series.add(name)
+                self.pending_series.append((row_number, 'series', name, name, (name, genre, rating)))
+            self.links.add((name, service_name))
+            params = (self.services[service_name], name)
+            self.pending_links.append((row_number, 'series', name, (name, service_name), params))
+
+    def add_season(self, row_number, service_name, series_name, season_number, year, episodes):
+        if service_name not in self.services:
+            self.report.append((row_number, 'season', series_name, 'error', f"{service_name} does not exist on the system."))
+        elif (series_name, season_number) in self.seasons:
+            season_service = self.seasons[(series_name, season_number)]
+            self.report.append((row_number, 'season', series_name, 'conflict',
+                                f"{series_name} season {season_number} already exists on {season_service}."))
+        elif (series_name, service_name) not in self.links:
+            self.report.append((row_number, 'season', series_name, 'error', f"{series_name} was not found on {service_name}."))
+        else:
+            self.seasons[(series_name, season_number)] = service_name
+            params = (season_number, year, episodes, self.services[service_name], series_name)
+            self.pending_seasons.append((row_number, 'season', series_name, (series_name, season_number), params))
+
+    def flush(self):
+        """Insert all pending rows, one executemany per table."""
+        failed_series = self.insert_many('''INSERT INTO TV_Series (Name, Genre, Rating) VALUES (?, ?, ?)''',
+                                         self.pending_series, self.series, report=False)
+        # Every link to a series that failed goes with it, not only the link from the same row
+        failed_names = {entry[2]: failed_series[entry[0]] for entry in self.pending_series if entry[0] in failed_series}
+        links = []
+        for entry in self.pending_links:
+            if entry[2] in failed_names:
+                self.links.discard(entry[3])
+                self.report.append(entry[:3] + ('error', failed_names[entry[2]]))
+            else:
+                links.append(entry)
+        # Series IDs are looked up by name, as new series were only just inserted
+        self.insert_many('''INSERT INTO Series_Service (Series_ID, Service_ID)
+                            SELECT ID, ? FROM TV_Series WHERE Name = ?''', links, self.links)
+        self.insert_many('''INSERT INTO Movies (Name, Year, Genre, Rating, Runtime, Service_ID)
+                            VALUES (?, ?, ?, ?, ?, ?)''', self.pending_movies, self.movies)
+
+        seasons = []
+        for entry in self.pending_seasons:
+            series_name, service_name = entry[2], self.seasons[entry[3]]
+            if (series_name, service_name) in self.links:
+                seasons.append(entry)
+            else:
+                del self.seasons[entry[3]]
+                self.report.append(entry[:3] + ('error', f"{series_name} was not found on {service_name}."))
+        self.insert_many('''INSERT INTO Season (Series_ID, Season_Number, Year, Episodes_Number, Service_ID)
+                            SELECT ID, ?, ?, ?, ? FROM TV_Series WHERE Name = ?''', seasons, self.seasons)
+
+        self.pending_series, self.pending_links, self.pending_movies, self.pending_seasons = [], [], [], []
+
+    def insert_many(self, query, pending, keys, report=True):
+        """Insert a batch with executemany, falling back to row by row if a constraint fails.
+
+        Returns a dict of row_number -> error message for the rows that were rejected.
+        """
+        failed = {}
+        if not pending:
+            return failed
+        self.cursor.execute('''SAVEPOINT bulk_import''')
+        try:
+            self.cursor.executemany(query, [entry[4] for entry in pending])
+            # An INSERT ... SELECT whose series is missing inserts nothing instead of raising
+            complete = self.cursor.rowcount == len(pending)
+        except sqlite3.IntegrityError:
+            complete = False
+        if not complete:
+            # Find out which rows were at fault
+            self.cursor.execute('''ROLLBACK TO bulk_import''')
+            for row_number, kind, name, key, params in pending:
+                try:
+                    self.cursor.execute(query, params)
+                    if not self.cursor.rowcount:
+                        failed[row_number] = f"Series '{name}' not found."
+                except sqlite3.IntegrityError as e:
+                    failed[row_number] = str(e)
+                if row_number in failed:
+                    if isinstance(keys, dict):
+                        del keys[key]
+                    else:
+                        keys.discard(key)
+        self.cursor.execute('''RELEASE bulk_import''')
+
+        if report:
+            for row_number, kind, name, key, params in pending:
+                if row_number in failed:
+                    self.report.append((row_number, kind, name, 'error', failed[row_number]))
+                else:
+                    self.report.append((row_number, kind, name, 'added', f"{name} was successfully added."))
+        return failed
+
+
+def _import_int(value, field):
+    """Convert an imported value to int, refusing text and fractions that are not whole numbers."""
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid {field} '{value}'.")
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid {field} '{value}'.")
+
+
+def validate_import_row(row):
+    """Return the columns of an import row in IMPORT_COLUMNS order, or raise ValueError saying why it is rejected.
+
+    Applies the NOT NULL and CHECK constraints of the catalog tables, so a
+    row that passes can only be rejected for a conflict. Both bulk_import
+    and loader.py check rows with it.
+    """
+    kind = row.get('type')
+    if kind not in IMPORT_COLUMNS:
+        raise ValueError(f"Unknown row type '{kind}'.")
+    values = []
+    for field in IMPORT_COLUMNS[kind]:
+        value = row.get(field)
+        if value is None or value == '':
+            if field in IMPORT_REQUIRED:
+                raise ValueError(f"Missing {field}.")
+            value = None
+        elif field in IMPORT_INTEGERS:
+            value = _import_int(value, field)
+            low, high = IMPORT_RANGES.get((kind, field), (None, None))
+            if high is None and low is not None and value < low:
+                raise ValueError(f"{field.capitalize()} must be at least {low}.")
+            if high is not None and not low <= value <= high:
+                raise ValueError(f"{field.capitalize()} must be between {low} and {high}.")
+        values.append(value)
+    return tuple(values)
+
+
+def read_import_file(path):
+    """Yield rows from a .csv or .jsonl catalog file as dicts, one at a time.
+
+    A line that is not valid JSON is yielded as None, so bulk_import reports
+    it as a rejected row instead of abandoning the whole file.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if value != ''}
+        else:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+
+
+def import_catalog(db_name, path):
+    """Load a catalog file into the database and print a summary of rejected rows."""
+    service = Service(db_name)
+    try:
+        report = service.bulk_import(read_import_file(path))
+    finally:
+        service.close()
+
+    added = 0
+    for row_number, kind, name, status, message in report:
+        if status == 'added':
+            added += 1
+        else:
+            print(f"Row {row_number} ({kind} '{name}'): {status}: {message}")
+    print(f"Imported {added} of {len(report)} rows from '{path}'.")
+    return report
+
+
+def print_stats(db_name, service_name=None):
+    """Print the catalog totals of one service, or of every service."""
+    service = Service(db_name)
+    try:
+        stats = service.service_stats(service_name)
+    finally:
+        service.close()
+
+    if not stats:
+        print(f"Service '{service_name}' not found." if service_name else "No services found.")
+    for entry in stats:
+        rating = 'n/a' if entry.avg_rating is None else f"{entry.avg_rating:.2f}"
+        print(f"{entry.name}: {entry.movies} movies, {entry.series} series, {entry.seasons} seasons, "
+              f"{entry.episodes} episodes, average rating {rating}, runtime {entry.total_runtime} min")
+    return stats
 
 
 def main_menu():
-    service = Service('test.db')
+    service = Service(DB_NAME)
 
     while True:
         print("\nWelcome to the Movie Service Management System!")
@@ -537,9 +1848,12 @@ def main_menu():
             exists = service.name_check(service_name)
             if exists:
                 result = (service.list_series(service_name))
-                if result: 
+                if isinstance(result, str):
+                    print(result)
+                else:
                     for series in result:
-                        print(f"Name: {series[0]}, Season: {series[1]}, Year: {series[2]}, Episodes: {series[3]}")
+                        print(f"Name: {series.series_name}, Season: {series.season_number}, Year: {series.year}, "
+                              f"Episodes: {series.episodes_number}")
             else:
                 print(f"Service '{service_name}' not found.")
 
@@ -554,5 +1868,24 @@ def main_menu():
             print("Invalid choice! Please choose a valid option (1-12).")
 
 
-# Run the main menu
-main_menu()
+def main(argv):
+    if len(argv) == 2 and argv[0] == 'import':
+        import_catalog(DB_NAME, argv[1])
+    elif 1 <= len(argv) <= 2 and argv[0] == 'stats':
+        print_stats(DB_NAME, *argv[1:])
+    elif 2 <= len(argv) <= 3 and argv[0] == 'snapshot-export':
+        import snapshot
+        since = snapshot.read_watermark(argv[2]) if len(argv) == 3 else None
+        snapshot.export_snapshot(DB_NAME, argv[1], since)
+    elif len(argv) == 2 and argv[0] == 'snapshot-import':
+        import snapshot
+        snapshot.import_snapshot(DB_NAME, argv[1])
+    elif argv:
+        print("Usage: main.py [import <file.csv|file.jsonl> | stats [service] | "
+              "snapshot-export <file> [<previous snapshot>] | snapshot-import <file>]")
+    else:
+        main_menu()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
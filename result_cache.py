@@ -0,0 +1,113 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def _estimate_size(rows):
+    """Rough number of bytes held by a list of row tuples."""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+class ResultCache:
+    """LRU cache of listing results, grouped by service so writes can invalidate them.
+
+    Entries expire after ttl seconds (never if ttl is None) and the least
+    recently used ones are evicted once there are more than max_entries or
+    they hold more than max_bytes.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, ttl=None, max_bytes=RESULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (service, expires, size, rows), most recently used last
+        self._entries = OrderedDict()
+        self._by_service = {}
+        # Bumped by every invalidation, so rows loaded before one are not stored after it
+        self._generation = 0
+        self._service_generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached rows for key, or None if they are missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def generation(self, service):
+        """Return a token to pass to put() for rows about to be loaded for service."""
+        with self._lock:
+            return self._generation, self._service_generations.get(service, 0)
+
+    def put(self, key, service, rows, generation=None):
+        """Cache rows for key; they are dropped if service was invalidated since generation was taken."""
+        size = _estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if generation is not None and generation != (self._generation,
+                                                          self._service_generations.get(service, 0)):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (service, expires, size, rows)
+            self._by_service.setdefault(service, set()).add(key)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, service=None):
+        """Drop every entry for one service, or the whole cache if service is None."""
+        with self._lock:
+            if service is None:
+                self._generation += 1
+                self._service_generations.clear()
+                self._entries.clear()
+                self._by_service.clear()
+                self.bytes = 0
+            else:
+                self._service_generations[service] = self._service_generations.get(service, 0) + 1
+                for key in self._by_service.pop(service, ()):
+                    self._remove(key)
+
+    def _remove(self, key):
+        service, expires, size, rows = self._entries.pop(key)
+        self.bytes -= size
+        keys = self._by_service.get(service)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_service[service]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+            }
@@ -0,0 +1,215 @@
+"""Serve Service operations over a JSON-lines protocol.
+
+Each request is one JSON object per line and gets one response line, in
+order:
+
+    {"id": 1, "op": "add_movie", "args": ["Netflix", "Heat", 1995, "Crime", 5, 170]}
+    {"id": 1, "ok": true, "result": null, "messages": ["Movie 'Heat' added to service 'Netflix'."]}
+
+args is either a list of positional arguments or an object of keyword
+arguments. Records come back as objects and whatever the method printed
+is returned in messages. A failed request has "ok": false and an
+"error" instead of a result.
+
+Requests can be pipelined. The ones already waiting when a batch starts
+(up to --batch) run in a single transaction, each in its own savepoint,
+so a failing request does not undo the others:
+
+    python server.py --db test.db                       # stdin/stdout
+    python server.py --db test.db --socket /tmp/catalog.sock
+    python server.py --db test.db --replay recorded.jsonl
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+
+from main import DB_NAME, Service
+
+MAX_BATCH = 64
+
+# Service methods a request may call
+OPERATIONS = {
+    'add_service', 'remove_service', 'list_services', 'services_page', 'name_check', 'get_service_id',
+    'add_movie', 'remove_movie', 'edit_ranking', 'movie_check', 'name_year_check', 'check_movies',
+    'list_movies', 'movies_page',
+    'add_series', 'remove_series', 'remove_series_from_service', 'add_ranking_series',
+    'add_season', 'remove_season', 'check_seasons', 'list_series', 'seasons_page',
+    'search', 'service_stats', 'genre_histogram', 'year_distribution', 'episodes_per_series',
+    'changes', 'last_change_seq', 'service_cache_stats', 'top_movies', 'top_series', 'similar_movies',
+}
+
+
+def _to_json(value):
+    """Convert a method's return value to plain JSON types; records become objects."""
+    if isinstance(value, tuple) and hasattr(value, '_asdict'):
+        return {key: _to_json(item) for key, item in value._asdict().items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((_to_json(item) for item in value), key=json.dumps)
+    if isinstance(value, dict):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    return value
+
+
+def _from_json(value):
+    """Turn JSON arrays inside an argument into tuples, as keys and cursors are tuples."""
+    if isinstance(value, list):
+        return tuple(_from_json(item) for item in value)
+    return value
+
+
+def _request_id(line):
+    """Return the id of a request line, or None if it has none or is not valid JSON."""
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return None
+    return request.get('id') if isinstance(request, dict) else None
+
+
+def _execute(service, line):
+    """Run one request line and return its response."""
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return {'id': None, 'ok': False, 'error': "Invalid JSON."}
+    if not isinstance(request, dict):
+        return {'id': None, 'ok': False, 'error': "A request must be a JSON object."}
+
+    response = {'id': request.get('id')}
+    op = request.get('op')
+    args = request.get('args', [])
+    if op not in OPERATIONS:
+        response.update(ok=False, error=f"Unknown operation '{op}'.")
+        return response
+    if not isinstance(args, (list, dict)):
+        response.update(ok=False, error="args must be a list or an object.")
+        return response
+
+    method = getattr(service, op)
+    messages = io.StringIO()
+    try:
+        with service.transaction(), contextlib.redirect_stdout(messages):
+            if isinstance(args, dict):
+                result = method(**{key: _from_json(value) for key, value in args.items()})
+            else:
+                result = method(*(_from_json(value) for value in args))
+    except Exception as e:
+        # Any failure belongs to this request only; its savepoint has been rolled back
+        response.update(ok=False, error=str(e) or type(e).__name__)
+    else:
+        response.update(ok=True, result=_to_json(result))
+    response['messages'] = messages.getvalue().splitlines()
+    return response
+
+
+def run_batch(service, lines):
+    """Run request lines in one transaction, each in its own savepoint, and return their responses."""
+    try:
+        with service.transaction():
+            return [_execute(service, line) for line in lines]
+    except Exception as e:
+        # The commit itself failed, so none of the batch was applied
+        return [{'id': _request_id(line), 'ok': False, 'error': f"Commit failed: {e}"} for line in lines]
+
+
+def serve(service, lines, out, max_batch=MAX_BATCH):
+    """Answer every request read from lines on out, batching the requests already waiting."""
+    pending = queue.Queue()
+
+    def read():
+        for line in lines:
+            if line.strip():
+                pending.put(line)
+        pending.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    while True:
+        batch = [pending.get()]
+        while batch[-1] is not None and len(batch) < max_batch:
+            try:
+                batch.append(pending.get_nowait())
+            except queue.Empty:
+                break
+        finished = batch[-1] is None
+        if finished:
+            batch.pop()
+        if batch:
+            for response in run_batch(service, batch):
+                out.write(json.dumps(response) + '\n')
+            out.flush()
+        if finished:
+            return
+
+
+def replay(service, path, max_batch=MAX_BATCH, out=None):
+    """Run a recorded request file as fast as possible and return (requests, commits, seconds)."""
+    with open(path, encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    start = time.perf_counter()
+    commits = 0
+    for first in range(0, len(lines), max_batch):
+        responses = run_batch(service, lines[first:first + max_batch])
+        commits += 1
+        if out is not None:
+            out.writelines(json.dumps(response) + '\n' for response in responses)
+    return len(lines), commits, time.perf_counter() - start
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        lines = io.TextIOWrapper(self.rfile, encoding='utf-8')
+        out = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+        serve(self.server.service, lines, out, self.server.max_batch)
+
+
+class _SocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=DB_NAME, help='catalog database')
+    parser.add_argument('--batch', type=int, default=MAX_BATCH, help='most requests committed together')
+    parser.add_argument('--socket', help='listen on this Unix socket instead of stdin')
+    parser.add_argument('--replay', help='run a recorded request file and report its throughput')
+    parser.add_argument('--output', default=os.devnull, help='where --replay writes its responses')
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        service = Service(args.db)
+        with open(args.output, 'w') as out:
+            requests, commits, seconds = replay(service, args.replay, args.batch, out)
+        service.close()
+        print(f"Replayed {requests} requests in {seconds:.3f} s: {requests / seconds:.1f} requests/s, "
+              f"{commits} commits.")
+    elif args.socket:
+        service = Service(args.db, pooled=True)
+        with _SocketServer(args.socket, _Handler) as server:
+            server.service = service
+            server.max_batch = args.batch
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.unlink(args.socket)
+                service.close()
+    else:
+        service = Service(args.db)
+        try:
+            serve(service, sys.stdin, sys.stdout, args.batch)
+        finally:
+            service.close()
+
+
+if __name__ == '__main__':
+    main()
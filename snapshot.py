@@ -0,0 +1,274 @@
+"""Columnar catalog snapshots for copying a catalog between databases.
+
+A snapshot file holds the rows of every catalog table in row groups. Each
+column of a group is stored contiguously: integers as little-endian
+int64 arrays and text as an array of byte lengths followed by the UTF-8
+data, with a null bitmap in front of any column that has NULLs.
+
+    python main.py snapshot-export catalog.snap
+    python main.py snapshot-export changes.snap catalog.snap
+    python main.py snapshot-import catalog.snap
+
+Every snapshot records a watermark, the sequence number of the last
+Change_Log entry it includes. Exporting with the watermark of an earlier
+snapshot writes only the rows inserted or updated since then, followed by
+the keys of the rows deleted since then.
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from main import Service
+
+MAGIC = b'CATSNAP1'
+FORMAT_VERSION = 2
+ROW_GROUP_SIZE = 65536
+
+# Tables in foreign key order: name, (column, type) pairs and the columns an imported row is matched on
+TABLES = [
+    ('Services', [('ID', 'int'), ('Name', 'text'), ('Price', 'int')], ('ID',)),
+    ('Movies', [('ID', 'int'), ('Name', 'text'), ('Year', 'int'), ('Genre', 'text'), ('Rating', 'int'),
+                ('Runtime', 'int'), ('Service_ID', 'int')], ('ID',)),
+    ('TV_Series', [('ID', 'int'), ('Name', 'text'), ('Genre', 'text'), ('Rating', 'int')], ('ID',)),
+    ('Series_Service', [('Series_ID', 'int'), ('Service_ID', 'int')], ('Series_ID', 'Service_ID')),
+    ('Season', [('Series_ID', 'int'), ('Season_Number', 'int'), ('Year', 'int'), ('Episodes_Number', 'int'),
+                ('Service_ID', 'int')], ('Series_ID', 'Season_Number')),
+]
+
+_HEADER = struct.Struct('<8sI')
+_GROUP = struct.Struct('<BI')
+_END = 0xFF
+# Set in a group's table index when the group holds the keys of deleted rows
+_DELETED = 0x80
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def _upsert_query(table, columns, key):
+    """INSERT for one table that updates the row already stored under the same key instead of failing."""
+    names = [name for name, kind in columns]
+    query = f'''INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})
+                ON CONFLICT ({', '.join(key)}) DO '''
+    updates = [f'{name} = excluded.{name}' for name in names if name not in key]
+    return query + (f'''UPDATE SET {', '.join(updates)}''' if updates else '''NOTHING''')
+
+
+def _delete_query(table, key):
+    return f'''DELETE FROM {table} WHERE {' AND '.join(f'{name} = ?' for name in key)}'''
+
+
+def _key_columns(columns, key):
+    kinds = dict(columns)
+    return [(name, kinds[name]) for name in key]
+
+
+def _write_groups(out, flags, columns, cursor):
+    """Write the rows left in cursor as row groups and return how many there were."""
+    written = 0
+    while True:
+        rows = cursor.fetchmany(ROW_GROUP_SIZE)
+        if not rows:
+            return written
+        out.write(_GROUP.pack(flags, len(rows)))
+        for (name, kind), values in zip(columns, zip(*rows)):
+            _write_column(out, kind, values)
+        written += len(rows)
+
+
+def _write_column(out, kind, values):
+    if None in values:
+        bitmap = bytearray((len(values) + 7) // 8)
+        for index, value in enumerate(values):
+            if value is None:
+                bitmap[index >> 3] |= 1 << (index & 7)
+        out.write(b'\x01')
+        out.write(bitmap)
+    else:
+        out.write(b'\x00')
+
+    if kind == 'int':
+        data = array('q', [0 if value is None else value for value in values])
+    else:
+        encoded = [b'' if value is None else value.encode() for value in values]
+        data = array('I', map(len, encoded))
+    if _BIG_ENDIAN:
+        data.byteswap()
+    out.write(data)
+    if kind == 'text':
+        out.write(b''.join(encoded))
+
+
+def _read_column(view, offset, kind, count):
+    """Decode one column starting at offset and return (values, offset after it)."""
+    bitmap = None
+    if view[offset]:
+        bitmap = view[offset + 1:offset + 1 + (count + 7) // 8]
+        offset += len(bitmap)
+    offset += 1
+
+    data = array('q' if kind == 'int' else 'I')
+    end = offset + data.itemsize * count
+    data.frombytes(view[offset:end])
+    if _BIG_ENDIAN:
+        data.byteswap()
+    offset = end
+
+    if kind == 'int':
+        values = data.tolist()
+    else:
+        end = offset + sum(data)
+        raw = bytes(view[offset:end])
+        # ASCII text can be sliced as str, since byte and character offsets agree
+        text = raw.decode('ascii') if raw.isascii() else None
+        values = []
+        start = 0
+        for length in data:
+            stop = start + length
+            values.append(text[start:stop] if text is not None else raw[start:stop].decode())
+            start = stop
+        offset = end
+
+    if bitmap is not None:
+        for index in range(count):
+            if bitmap[index >> 3] >> (index & 7) & 1:
+                values[index] = None
+    return values, offset
+
+
+def _read_header(view, path):
+    if len(view) < _HEADER.size:
+        raise ValueError(f"'{path}' is not a catalog snapshot.")
+    magic, size = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a catalog snapshot.")
+    header = json.loads(bytes(view[_HEADER.size:_HEADER.size + size]))
+    if header['format'] != FORMAT_VERSION:
+        raise ValueError(f"'{path}' uses snapshot format {header['format']}, expected {FORMAT_VERSION}.")
+    return header, _HEADER.size + size
+
+
+def read_watermark(path):
+    """Return the watermark recorded in a snapshot, for use as the since of the next export."""
+    with open(path, 'rb') as f:
+        magic, size = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a catalog snapshot.")
+        return json.loads(f.read(size))['watermark']
+
+
+def export_snapshot(db_name, path, since=None):
+    """Write the catalog to a snapshot file and return the number of rows written per table.
+
+    since is the watermark of an earlier snapshot; when given only the
+    rows changed after it are written. Raises ValueError if the changes
+    after since have been trimmed from the log, as a full snapshot is then
+    needed. All tables are read in one transaction, so the snapshot is
+    consistent even while other connections write.
+    """
+    service = Service(db_name)
+    counts = {}
+    deleted = 0
+    try:
+        with service.transaction():
+            cursor = service.conn.cursor()
+            watermark = service.last_change_seq()
+            if since is not None:
+                (oldest,) = cursor.execute('''SELECT MIN(Seq) FROM Change_Log''').fetchone()
+                trimmed = watermark if oldest is None else oldest - 1
+                if since < trimmed:
+                    raise ValueError(f"Changes after {since} have been trimmed from the log; "
+                                     f"export a full snapshot instead.")
+            with open(path, 'wb') as out:
+                header = json.dumps({
+                    'format': FORMAT_VERSION,
+                    'since': since,
+                    'watermark': watermark,
+                    'tables': [{'name': table, 'columns': columns} for table, columns, key in TABLES],
+                }).encode()
+                out.write(_HEADER.pack(MAGIC, len(header)))
+                out.write(header)
+
+                if since is not None:
+                    # Deletions first and children before parents, so they never violate a foreign key
+                    for table_index, (table, columns, key) in reversed(list(enumerate(TABLES))):
+                        logged = [f"json_extract(Row_Key, '$.{name}')" for name in key]
+                        cursor.execute(f'''SELECT DISTINCT {', '.join(logged)} FROM Change_Log
+                                           WHERE Seq > ? AND Seq <= ? AND Table_Name = ? AND Op = 'delete'
+                                           AND NOT EXISTS (SELECT 1 FROM {table} WHERE {' AND '.join(
+                                               f'{name} = {value}' for name, value in zip(key, logged))})''',
+                                       (since, watermark, table))
+                        deleted += _write_groups(out, table_index | _DELETED, _key_columns(columns, key), cursor)
+
+                for table_index, (table, columns, key) in enumerate(TABLES):
+                    query = f'''SELECT {', '.join(name for name, kind in columns)} FROM {table}'''
+                    params = ()
+                    if since is not None:
+                        target = key[0] if len(key) == 1 else f"({', '.join(key)})"
+                        logged = ', '.join(f"json_extract(Row_Key, '$.{name}')" for name in key)
+                        query += f''' WHERE {target} IN (SELECT {logged} FROM Change_Log
+                                                         WHERE Seq > ? AND Seq <= ? AND Table_Name = ?)'''
+                        params = (since, watermark, table)
+                    cursor.execute(query + ''' ORDER BY rowid''', params)
+                    counts[table] = _write_groups(out, table_index, columns, cursor)
+                out.write(_GROUP.pack(_END, 0))
+    finally:
+        service.close()
+
+    print(f"Exported {sum(counts.values())} rows and {deleted} deletions to '{path}'.")
+    return counts
+
+
+def import_snapshot(db_name, path):
+    """Load a snapshot file into the database and return the number of rows read per table.
+
+    A full snapshot replaces the catalog; an incremental one is applied on
+    top of it, deleting the rows deleted at the source and updating rows
+    that already exist. Everything is loaded in a
+    single transaction, and a full snapshot rebuilds the search indexes once
+    at the end rather than row by row.
+    """
+    service = Service(db_name)
+    counts = {table: 0 for table, columns, key in TABLES}
+    deleted = 0
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                header, offset = _read_header(view, path)
+                tables = [(table['name'], [tuple(column) for column in table['columns']]) for table in header['tables']]
+                if [(table, columns) for table, columns, key in TABLES] != tables:
+                    raise ValueError(f"'{path}' was written for a different catalog schema.")
+                queries = [_upsert_query(*table) for table in TABLES]
+
+                full = header['since'] is None
+                with service.bulk_load() if full else service.transaction():
+                    cursor = service.conn.cursor()
+                    if full:
+                        for table, columns, key in reversed(TABLES):
+                            cursor.execute(f'''DELETE FROM {table}''')
+                    while True:
+                        table_index, count = _GROUP.unpack_from(view, offset)
+                        offset += _GROUP.size
+                        if table_index == _END:
+                            break
+                        table, columns, key = TABLES[table_index & ~_DELETED]
+                        if table_index & _DELETED:
+                            columns = _key_columns(columns, key)
+                        values = []
+                        for name, kind in columns:
+                            column, offset = _read_column(view, offset, kind, count)
+                            values.append(column)
+                        if table_index & _DELETED:
+                            cursor.executemany(_delete_query(table, key), zip(*values))
+                            deleted += count
+                        else:
+                            cursor.executemany(queries[table_index], zip(*values))
+                            counts[table] += count
+            finally:
+                view.release()
+    finally:
+        service.close()
+
+    print(f"Imported {sum(counts.values())} rows and {deleted} deletions from '{path}'.")
+    return counts
@@ -0,0 +1,81 @@
+"""Check the per-row report of bulk_import and what it writes."""
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from main import Service, read_import_file
+
+
+class BulkImportTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.service = Service(os.path.join(directory.name, 'catalog.db'))
+        self.addCleanup(self.service.close)
+
+    def statuses(self, report):
+        return [(row_number, status) for row_number, kind, name, status, message in report]
+
+    def test_invalid_lines_are_reported(self):
+        path = os.path.join(self.directory, 'catalog.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"type": "service", "name": "A", "price": 1}\n'
+                    '{not json\n'
+                    '[1, 2]\n'
+                    '{"type": "movie", "name": "M", "year": 2000, "genre": "Drama", "service": "A"}\n')
+        report = self.service.bulk_import(read_import_file(path))
+        self.assertEqual(self.statuses(report), [(1, 'added'), (2, 'error'), (3, 'error'), (4, 'added')])
+        self.assertEqual(report[1], (2, None, None, 'error', "Invalid JSON."))
+        self.assertEqual(self.service.movie_check('A', 'M'), True)
+
+    def test_invalid_values_are_reported(self):
+        rows = [
+            {'type': 'service', 'name': 'A', 'price': 1},
+            {'type': 'movie', 'service': 'A', 'name': 'M', 'year': 2000, 'genre': 'Drama', 'rating': 'abc'},
+            {'type': 'movie', 'service': 'A', 'name': 'M', 'year': 2000, 'genre': 'Drama', 'rating': 3.7},
+            {'type': 'movie', 'service': 'A', 'name': 'N', 'year': '2001', 'genre': 'Drama', 'rating': '4'},
+            {'type': 'series', 'service': 'A', 'name': 'S'},
+        ]
+        report = self.service.bulk_import(rows)
+        self.assertEqual([message for row_number, kind, name, status, message in report if status == 'error'],
+                         ["Invalid rating 'abc'.", "Invalid rating '3.7'.", "Missing genre."])
+        self.assertEqual(self.service.top_movies('A'), [(1, 'N', 2001, 'Drama', 4, None, 1)])
+
+    def test_valid_row_after_invalid_row_with_the_same_key(self):
+        report = self.service.bulk_import([
+            {'type': 'service', 'name': 'A', 'price': 1},
+            {'type': 'service', 'name': 'B', 'price': 1},
+            {'type': 'movie', 'service': 'A', 'name': 'M', 'year': 2000, 'genre': 'Drama', 'rating': 7},
+            {'type': 'movie', 'service': 'A', 'name': 'M', 'year': 2000, 'genre': 'Drama', 'rating': 3},
+            {'type': 'series', 'service': 'A', 'name': 'X', 'genre': 'Drama', 'rating': 9},
+            {'type': 'series', 'service': 'B', 'name': 'X', 'genre': 'Drama'},
+            {'type': 'season', 'service': 'B', 'series': 'X', 'season': 1},
+        ])
+        self.assertEqual(self.statuses(report)[2:], [(3, 'error'), (4, 'added'), (5, 'error'), (6, 'added'),
+                                                     (7, 'added')])
+        self.assertEqual(self.service.top_movies('A'), [(1, 'M', 2000, 'Drama', 3, None, 1)])
+        self.assertEqual(self.service.list_series('B'), [('X', 1, None, None, 1)])
+
+    def test_dependants_of_a_failed_series(self):
+        # A series the database refuses although the row itself is valid
+        self.service.conn.execute('''CREATE TRIGGER refuse_x BEFORE INSERT ON TV_Series WHEN new.Name = 'X' BEGIN
+                                         SELECT RAISE(ABORT, 'refused');
+                                     END''')
+        report = self.service.bulk_import([
+            {'type': 'service', 'name': 'A', 'price': 1},
+            {'type': 'service', 'name': 'B', 'price': 1},
+            {'type': 'series', 'service': 'A', 'name': 'X', 'genre': 'Drama'},
+            {'type': 'series', 'service': 'B', 'name': 'X', 'genre': 'Drama'},
+            {'type': 'season', 'service': 'B', 'series': 'X', 'season': 1},
+            {'type': 'series', 'service': 'B', 'name': 'Y', 'genre': 'Drama'},
+        ])
+        self.assertEqual(self.statuses(report)[2:], [(3, 'error'), (4, 'error'), (5, 'error'), (6, 'added')])
+        self.assertEqual(self.service.conn.execute('''SELECT COUNT(*) FROM Series_Service''').fetchone(), (1,))
+        self.assertEqual(self.service.conn.execute('''SELECT COUNT(*) FROM Season''').fetchone(), (0,))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+"""Check that the batched existence checks agree with the per-key ones."""
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from main import Service
+
+
+class CheckKeysTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.service = Service(os.path.join(directory.name, 'catalog.db'))
+        self.addCleanup(self.service.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.service.add_service('A', 10)
+            self.service.add_movie('A', 'M', 2000, 'Drama', 3, 90)
+            self.service.add_series('A', 'S', 'Drama', 4)
+            self.service.add_season('A', 'S', 1, 2000, 10)
+
+    def test_movies(self):
+        keys = [('M', 2000), ('M', '2000'), ('M', 2001), ('N', 2000)]
+        existing, missing = self.service.check_movies(keys, chunk_size=3)
+        self.assertEqual(existing, {('M', 2000), ('M', '2000')})
+        self.assertEqual(missing, {('M', 2001), ('N', 2000)})
+        for name, year in keys:
+            self.assertEqual((name, year) in missing, self.service.name_year_check(name, year))
+
+    def test_seasons(self):
+        existing, missing = self.service.check_seasons([('S', 1), ('S', '1'), ('S', 2), ('T', 1)])
+        self.assertEqual(existing, {('S', 1), ('S', '1')})
+        self.assertEqual(missing, {('S', 2), ('T', 1)})
+
+
+if __name__ == '__main__':
+    unittest.main()
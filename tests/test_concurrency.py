@@ -0,0 +1,97 @@
+"""Stress a pooled Service with mixed reads and writes from many threads."""
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+from main import Service
+
+THREADS = 8
+ROUNDS = 50
+
+
+class PooledStressTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # A short busy timeout makes writes that bypass the write lock fail quickly
+        self.service = Service(os.path.join(directory.name, 'catalog.db'), pooled=True, busy_timeout=0.2)
+        self.addCleanup(self.service.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for number in range(THREADS):
+                self.service.add_service(f'Service {number}', number)
+                self.service.add_series(f'Service {number}', f'Series {number}', 'Drama', 3)
+
+    def worker(self, number, start):
+        service_name = f'Service {number}'
+        series_name = f'Series {number}'
+        start.wait()
+        for round_number in range(ROUNDS):
+            if round_number % 5 == 0:
+                # Hold a transaction open while the other threads keep writing
+                with self.service.transaction():
+                    self.service.add_movie(service_name, f'Movie {number}/{round_number}', 2000, 'Drama', 3, 90)
+                    self.service.add_season(service_name, series_name, round_number, 2000, 10)
+            else:
+                self.service.add_movie(service_name, f'Movie {number}/{round_number}', 2000, 'Drama', 3, 90)
+            self.service.add_ranking_series(series_name, round_number % 6)
+            self.service.edit_ranking(service_name, f'Movie {number}/{round_number}', 4)
+            if round_number % 10 == 9:
+                self.service.trim_changes(self.service.last_change_seq() - 100)
+            self.service.movies_page(service_name, page_size=20)
+            self.service.list_series(service_name)
+            self.service.services_page()
+            self.service.search('drama')
+
+    def test_mixed_reads_and_writes(self):
+        start = threading.Barrier(THREADS)
+        errors = []
+
+        def run(number):
+            try:
+                self.worker(number, start)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(number,)) for number in range(THREADS)]
+        # Redirected once around every thread, as redirect_stdout is not thread safe
+        with contextlib.redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        for stats in self.service.service_stats():
+            self.assertEqual(stats.movies, ROUNDS)
+            self.assertEqual(stats.seasons, ROUNDS // 5)
+        self.assertEqual(self.service.service_stats(), self.service.service_stats(live=True))
+        self.assertEqual({movie.rating for movie in self.service.top_movies(limit=THREADS * ROUNDS)}, {4})
+
+    def test_uncommitted_service_ids_are_not_shared(self):
+        inserted = threading.Event()
+        checked = threading.Event()
+
+        def insert_and_roll_back():
+            with contextlib.suppress(RuntimeError), self.service.transaction():
+                self.service.add_service('Uncommitted', 1)
+                self.service.add_movie('Uncommitted', 'Movie', 2000, 'Drama', 3, 90)
+                inserted.set()
+                checked.wait()
+                raise RuntimeError
+
+        writer = threading.Thread(target=insert_and_roll_back)
+        with contextlib.redirect_stdout(io.StringIO()):
+            writer.start()
+            inserted.wait()
+            seen = self.service.name_check('Uncommitted'), self.service.get_service_id('Uncommitted')
+            checked.set()
+            writer.join()
+        self.assertEqual(seen, (False, False))
+        self.assertEqual(self.service.name_check('Uncommitted'), False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""Check that paging through movies_page returns every movie once, in order."""
+import contextlib
+import io
+import os
+import random
+import tempfile
+import unittest
+
+from main import MOVIE_ORDERS, Service
+
+
+def _expected(movies, order_by, descending):
+    """Sort movies as movies_page should: NULLs lowest, ties by ID in the order's tie direction."""
+    column, position, reverse_ties = MOVIE_ORDERS[order_by]
+    ties_descending = descending != reverse_ties
+    # Python's sort is stable, so sort by the tie breaker first
+    movies = sorted(movies, key=lambda movie: movie.id, reverse=ties_descending)
+    return sorted(movies, key=lambda movie: (movie[position] is not None, movie[position] or 0), reverse=descending)
+
+
+class MoviesPageTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.service = Service(os.path.join(directory.name, 'catalog.db'))
+        self.addCleanup(self.service.close)
+        choice = random.Random(6).choice
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.service.add_service('A', 10)
+            self.service.add_service('B', 10)
+            for number in range(120):
+                self.service.add_movie(choice('AB'), f'Movie {choice("XYZ")}', choice([None, 1990, 2000, 2010]),
+                                       choice(['Drama', 'Comedy']), choice([None, 0, 3, 5]), 90)
+        self.movies = [movie for movie in self.service.top_movies(limit=-1) if movie.service_id == 1]
+
+    def test_pages_follow_the_order(self):
+        for order_by in MOVIE_ORDERS:
+            for descending in (False, True):
+                for page_size in (1, 7, 500):
+                    with self.subTest(order_by=order_by, descending=descending, page_size=page_size):
+                        movies = list(self.service.iter_movies('A', page_size, order_by=order_by,
+                                                               descending=descending))
+                        self.assertEqual(movies, _expected(self.movies, order_by, descending))
+
+    def test_filtered_pages(self):
+        movies = list(self.service.iter_movies('A', 4, genre='Drama', min_rating=3, order_by='rating',
+                                               descending=True))
+        expected = [movie for movie in self.movies if movie.genre == 'Drama' and (movie.rating or 0) >= 3]
+        self.assertEqual(movies, _expected(expected, 'rating', True))
+
+
+if __name__ == '__main__':
+    unittest.main()
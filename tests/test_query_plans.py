@@ -0,0 +1,121 @@
+"""Check that no Service query falls back to a full table scan.
+
+Every statement run by a public Service method is captured with a trace
+callback, and its EXPLAIN QUERY PLAN must not scan a catalog table unless
+the method is expected to read the whole table.
+"""
+import contextlib
+import io
+import os
+import re
+import tempfile
+import unittest
+
+from main import Service
+
+CATALOG_TABLES = {'Services', 'Movies', 'TV_Series', 'Series_Service', 'Season', 'Change_Log'}
+
+# Method calls in the order they are run: name, args, kwargs and the tables the call may scan in full
+CALLS = [
+    ('add_service', ('C', 3), {}, ()),
+    ('add_movie', ('A', 'N', 2001, 'Drama', 4, 100), {}, ()),
+    ('add_series', ('A', 'T', 'Drama', 2), {}, ()),
+    ('add_season', ('A', 'T', 1, 2001, 8), {}, ()),
+    ('name_check', ('A',), {}, ()),
+    ('get_service_id', ('A',), {}, ()),
+    ('movie_check', ('A', 'M'), {}, ()),
+    ('name_year_check', ('M', 2000), {}, ()),
+    ('check_movies', ([('M', 2000), ('X', 1999)],), {}, ()),
+    ('check_seasons', ([('S', 1), ('S', 9)],), {}, ()),
+    # Services are paged in ID order from the start of the table
+    ('list_services', (), {}, ('Services',)),
+    ('services_page', (1,), {}, ()),
+    ('list_movies', ('A',), {}, ()),
+    ('movies_page', ('A', (2000, 1), 10), {'order_by': 'year'}, ()),
+    ('movies_page', ('A', (None, 1), 10), {'order_by': 'year'}, ()),
+    ('movies_page', ('A', (2000, 1), 10), {'order_by': 'year', 'descending': True}, ()),
+    ('movies_page', ('A', (3, 1), 10), {'order_by': 'rating'}, ()),
+    ('movies_page', ('A', (3, 1), 10), {'order_by': 'rating', 'descending': True}, ()),
+    ('movies_page', ('A', (None, 1), 10), {'order_by': 'rating', 'descending': True}, ()),
+    ('movies_page', ('A', ('M', 1), 10), {'order_by': 'name', 'genre': 'Drama'}, ()),
+    ('list_series', ('A',), {}, ()),
+    ('seasons_page', ('A', (1, 1)), {}, ()),
+    ('search', ('dra',), {}, ()),
+    ('service_stats', ('A',), {}, ()),
+    ('service_stats', ('A',), {'live': True}, ()),
+    # Totals of every service read every service
+    ('service_stats', (), {}, ('Services',)),
+    ('genre_histogram', ('A',), {}, ()),
+    ('year_distribution', ('A',), {}, ()),
+    ('episodes_per_series', ('A',), {}, ()),
+    ('top_movies', (), {}, ()),
+    ('top_movies', ('A', 'Drama'), {}, ()),
+    ('top_series', (), {}, ()),
+    ('top_series', ('A',), {}, ()),
+    ('similar_movies', ('A', 'M'), {}, ()),
+    ('changes', (1,), {}, ()),
+    ('last_change_seq', (), {}, ()),
+    ('edit_ranking', ('A', 'M', 5), {}, ()),
+    ('add_ranking_series', ('S', 5), {}, ()),
+    ('remove_season', ('T', 1), {}, ()),
+    ('remove_series_from_service', ('T', 'A'), {}, ()),
+    ('remove_series', ('A', 'S'), {}, ()),
+    ('remove_movie', ('A', 'N'), {}, ()),
+    ('trim_changes', (2,), {}, ()),
+    ('remove_service', ('B',), {}, ()),
+]
+
+# Methods that run no queries of their own, or that read whole tables by design
+UNCHECKED = {
+    'close', 'transaction', 'group_commit', 'bulk_load', 'create_tables', 'migrate', 'subscribe', 'unsubscribe',
+    'invalidate_service_cache', 'service_cache_stats', 'iter_services', 'iter_movies', 'iter_seasons',
+    # Loads every existing key once before checking the rows
+    'bulk_import',
+}
+
+# Pages must be read in index order, or every page sorts all the rows before its cursor again
+PAGED = {'list_services', 'services_page', 'list_movies', 'movies_page', 'seasons_page'}
+
+_QUERY = re.compile(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+_SCAN = re.compile(r'SCAN (\w+)$')
+
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.service = Service(os.path.join(directory.name, 'catalog.db'))
+        self.addCleanup(self.service.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.service.add_service('A', 10)
+            self.service.add_service('B', 5)
+            self.service.add_movie('A', 'M', 2000, 'Drama', 3, 90)
+            self.service.add_movie('B', 'M', 2003, 'Comedy', None, 95)
+            self.service.add_series('A', 'S', 'Drama', 4)
+            self.service.add_season('A', 'S', 1, 2000, 10)
+
+    def test_every_query_method_is_checked(self):
+        methods = {name for name, member in vars(Service).items() if not name.startswith('_') and callable(member)}
+        self.assertEqual(methods - UNCHECKED - {call[0] for call in CALLS}, set())
+
+    def test_no_full_table_scans(self):
+        statements = []
+        conn = self.service.conn
+        conn.set_trace_callback(statements.append)
+        for name, args, kwargs, allowed in CALLS:
+            statements.clear()
+            with contextlib.redirect_stdout(io.StringIO()):
+                getattr(self.service, name)(*args, **kwargs)
+            # Trigger bodies are traced as comments and checked through their own tables' indexes
+            queries = [statement for statement in statements if _QUERY.match(statement)]
+            for query in queries:
+                plan = [row[3] for row in conn.execute('''EXPLAIN QUERY PLAN ''' + query)]
+                scanned = {match.group(1) for match in map(_SCAN.match, plan) if match}
+                with self.subTest(method=name, query=' '.join(query.split())):
+                    self.assertEqual((scanned & CATALOG_TABLES) - set(allowed), set(), plan)
+                    if name in PAGED:
+                        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
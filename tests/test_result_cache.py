@@ -0,0 +1,62 @@
+"""Check that cached listings never outlive a write to their service."""
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+from main import Service
+from result_cache import ResultCache
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_put_after_invalidation_is_dropped(self):
+        cache = ResultCache()
+        generation = cache.generation(1)
+        cache.invalidate(1)
+        cache.put(('list_movies', 1), 1, ('stale',), generation)
+        self.assertIsNone(cache.get(('list_movies', 1)))
+
+        generation = cache.generation(1)
+        cache.invalidate(2)
+        cache.put(('list_movies', 1), 1, ('current',), generation)
+        self.assertEqual(cache.get(('list_movies', 1)), ('current',))
+
+    def test_load_overlapping_a_write_is_not_cached(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        service = Service(os.path.join(directory.name, 'catalog.db'), pooled=True, result_cache=ResultCache())
+        self.addCleanup(service.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            service.add_service('A', 10)
+            service.add_movie('A', 'M1', 2000, 'Drama', 3, 90)
+
+        loaded = threading.Event()
+        written = threading.Event()
+        iter_movies = service.iter_movies
+
+        def slow_iter_movies(*args, **kwargs):
+            movies = list(iter_movies(*args, **kwargs))
+            loaded.set()
+            written.wait()
+            return movies
+
+        service.iter_movies = slow_iter_movies
+        reader = threading.Thread(target=service.list_movies, args=('A',))
+        with contextlib.redirect_stdout(io.StringIO()):
+            reader.start()
+            loaded.wait()
+            service.add_movie('A', 'M2', 2001, 'Drama', 3, 90)
+            written.set()
+            reader.join()
+        del service.iter_movies
+
+        self.assertIsNone(service.result_cache.get(('list_movies', 1)))
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            service.list_movies('A')
+        self.assertIn('M2', out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Check that incremental snapshots carry every change or refuse to be written."""
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from main import Service
+from snapshot import export_snapshot, import_snapshot, read_watermark
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = lambda name: os.path.join(directory.name, name)
+        self.db = self.path('catalog.db')
+        self.add_movie('M')
+
+    def add_movie(self, name, trim=False):
+        service = Service(self.db)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if not service.name_check('A'):
+                service.add_service('A', 10)
+            service.add_movie('A', name, 2000, 'Drama', 3, 90)
+            if trim:
+                service.trim_changes(service.last_change_seq())
+        service.close()
+
+    def export(self, name, since=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return export_snapshot(self.db, self.path(name), since)
+
+    def test_incremental_export_after_trim_raises(self):
+        self.export('full.snap')
+        self.add_movie('N', trim=True)
+        self.add_movie('O')
+        with self.assertRaises(ValueError):
+            self.export('changes.snap', read_watermark(self.path('full.snap')))
+        self.assertFalse(os.path.exists(self.path('changes.snap')))
+
+    def test_incremental_export_after_full_trim_raises(self):
+        self.export('full.snap')
+        self.add_movie('N', trim=True)
+        with self.assertRaises(ValueError):
+            self.export('changes.snap', read_watermark(self.path('full.snap')))
+
+    def test_incremental_export_from_a_later_snapshot(self):
+        self.export('full.snap')
+        self.add_movie('N', trim=True)
+        self.export('full2.snap')
+        self.add_movie('O')
+        self.assertEqual(self.export('changes.snap', read_watermark(self.path('full2.snap')))['Movies'], 1)
+
+        replica = self.path('replica.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            import_snapshot(replica, self.path('full2.snap'))
+            import_snapshot(replica, self.path('changes.snap'))
+        service = Service(replica)
+        self.addCleanup(service.close)
+        self.assertEqual([movie.name for movie in service.top_movies()], ['M', 'N', 'O'])
+
+
+if __name__ == '__main__':
+    unittest.main()